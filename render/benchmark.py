@@ -0,0 +1,231 @@
+import os, sys, glob, json, time, struct, random, shutil, tempfile, platform, statistics, datetime
+from concurrent.futures import ProcessPoolExecutor
+import PIL
+from rift_essentials import *
+from parse import EVENT_RECORD, parse_chart
+from flatten import create_segment, flatten_chart, get_segment_beats, NoteIndex
+from render_html import write_chart_html
+
+try:
+    import resource
+except ImportError:
+    resource = None     # peak memory is only measured where resource exists (not on Windows)
+
+# Render benchmark on synthetic data.
+# A capture and its chart metadata are generated from a seed in a scratch directory, so the benchmark
+# runs offline and never touches raw/, json/ or flat/. Every stage is timed in a fresh worker process,
+# so its peak memory is its own, and the results are saved as JSON to compare between runs.
+
+BENCH_NAME      = "Benchmark"
+BENCH_BPM       = 120
+BENCH_DIVISIONS = 8
+NOTES_PER_BEAT  = 2             # average density of short notes
+NOTE_GRID       = 4             # notes snap to 1/4 beats
+WYRM_LENGTHS    = (1, 2, 4, 8)  # in beats
+
+STAGES = ["parse", "load_chart", "create_segment", "flatten", "flatten_er", "render_html"]
+
+# enemy sprites the synthetic notes can use, in a fixed order so that a seed gives the same chart
+def get_enemy_pool(variety: int) -> list[EnemyType]:
+    pool = [enemy_type for enemy_type in EnemyType if enemy_type not in (EnemyType.NONE, EnemyType.WYRM)]
+    return pool[:max(1, min(variety, len(pool)))]
+
+# event records (see parse.EVENT_RECORD) of a synthetic chart, sorted by time
+def generate_events(config: dict) -> list[tuple]:
+    rng = random.Random(config["seed"])
+    enemy_pool = get_enemy_pool(config["enemies"])
+    wyrm_count = int(config["notes"] * config["wyrm_ratio"])
+    short_count = config["notes"] - wyrm_count
+    beat_count = max(16, config["notes"] // NOTES_PER_BEAT)
+
+    def create_record(event_type: EventType, beat: float, enemy_type: EnemyType, column: int) -> tuple:
+        time = (beat - 1) * 60 / BENCH_BPM
+        return (event_type.value, time, beat, time, beat, enemy_type.value, column, 0, 0, 1, 1, 0, False)
+
+    records = []
+    # wyrms never overlap in a column, short notes land anywhere else
+    wyrm_spans = {column: [] for column in range(3)}
+    for _ in range(wyrm_count):
+        column = rng.randrange(3)
+        start = 1 + rng.randrange(beat_count * NOTE_GRID) / NOTE_GRID
+        finish = start + rng.choice(WYRM_LENGTHS)
+        if any(start <= span_finish and span_start <= finish for span_start, span_finish in wyrm_spans[column]):
+            continue
+        wyrm_spans[column].append((start, finish))
+        records.append(create_record(EventType.HIT, start, EnemyType.WYRM, column))
+        records.append(create_record(EventType.HOLD_COMPLETE, finish, EnemyType.WYRM, column))
+        beat = start + 1 / NOTE_GRID
+        while beat < finish:
+            records.append(create_record(EventType.HOLD_SEGMENT, beat, EnemyType.WYRM, column))
+            beat += 1 / NOTE_GRID
+
+    for _ in range(short_count):
+        beat = 1 + rng.randrange(beat_count * NOTE_GRID) / NOTE_GRID
+        records.append(create_record(EventType.HIT, beat, rng.choice(enemy_pool), rng.randrange(3)))
+
+    # vibe gains spread evenly, the solver in parse picks the optimal vibes from them
+    for index in range(config["vibes"]):
+        records.append(create_record(EventType.VIBE_GAINED, 1 + beat_count * (index + 1) / (config["vibes"] + 1), EnemyType.NONE, 0))
+
+    return sorted(records, key=lambda record: (record[1], record[0]))
+
+def write_string(f, text: str):
+    data = text.encode("utf-8")
+    f.write(struct.pack("<b", len(data)))
+    f.write(data)
+
+# writes a capture in the layout parse.py reads
+def write_capture(path, records: list[tuple]):
+    with open(path, "wb") as f:
+        write_string(f, "RIFT_EVENT_CAPTURE")
+        f.write(struct.pack("<i", 0))
+        write_string(f, BENCH_NAME)
+        write_string(f, f"RR{BENCH_NAME}")
+        f.write(struct.pack("<i", DifficultyType.IMPOSSIBLE.value))
+        f.write(struct.pack("<i", 0))   # no pins
+        f.write(struct.pack("<iii", BENCH_BPM, BENCH_DIVISIONS, 0))
+        f.write(struct.pack("<i", len(records)))
+        for record in records:
+            f.write(EVENT_RECORD.pack(*record))
+
+# hand-edited metadata of the chart JSON: bpm changes, spread evenly over the chart
+def create_metadata(config: dict, last_beat: float) -> Chart:
+    rng = random.Random(config["seed"])
+    chart = Chart()
+    chart.id = f"{BENCH_NAME}_{DifficultyType.IMPOSSIBLE.value}"
+    chart.name = BENCH_NAME
+    chart.short_name = BENCH_NAME
+    chart.difficulty = DifficultyType.IMPOSSIBLE
+    chart.intensity = 30
+    chart.bpm_changes = [BpmChange(1, BENCH_BPM)]
+    for index in range(1, config["bpm_changes"] + 1):
+        chart.bpm_changes.append(BpmChange(1 + int(last_beat * index / (config["bpm_changes"] + 1)), rng.randrange(80, 240)))
+    return chart
+
+# writes raw/ and json/ of the synthetic chart into the current directory, returns (capture, JSON) paths
+def generate_data(config: dict) -> tuple[str, str]:
+    for path in (PATH_RAW, PATH_JSON, PATH_FLAT, PATH_HTML):
+        os.makedirs(path, exist_ok=True)
+
+    records = generate_events(config)
+    bin_path = os.path.join(PATH_RAW, f"{BENCH_NAME}_Impossible.bin")
+    write_capture(bin_path, records)
+
+    json_path = f"{PATH_JSON}/{BENCH_NAME}_{DifficultyType.IMPOSSIBLE.value}.json"
+    save_chart(create_metadata(config, max(record[4] for record in records)), json_path)
+    save_chart(parse_chart(bin_path), json_path)
+    return bin_path, json_path
+
+def get_peak_rss_mb() -> float:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# runs in a fresh worker process, returns wall time and peak memory of one stage
+def measure_stage(stage: str, bin_path, json_path) -> dict:
+    chart = None if stage in ("parse", "load_chart") else load_chart_file(json_path, use_cache=False)
+
+    start_time = time.perf_counter()
+    if stage == "parse":
+        parse_chart(bin_path)
+    elif stage == "load_chart":
+        load_chart_file(json_path, use_cache=False)
+    elif stage == "create_segment":
+        note_index = NoteIndex(chart)
+        for beat_start in get_segment_beats(chart):
+            create_segment(beat_start, chart, False, note_index)
+    elif stage == "flatten":
+        flatten_chart(chart, False)
+    elif stage == "flatten_er":
+        flatten_chart(chart, True)
+    elif stage == "render_html":
+        write_chart_html(chart)
+    wall = time.perf_counter() - start_time
+
+    return {"wall": wall, "peak_rss_mb": get_peak_rss_mb()}
+
+def run_benchmark(config: dict, stages: list[str], repeat: int) -> dict:
+    results = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": config,
+        "environment": {"python": platform.python_version(), "pillow": PIL.__version__,
+                        "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "stages": {},
+    }
+
+    # fonts next to the scripts are copied along, the scratch directory is the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        try:
+            shutil.copytree(PATH_ENEMIES, os.path.join(scratch, PATH_ENEMIES))
+            for font_path in glob.glob("*.ttf"):
+                shutil.copy(font_path, scratch)
+            os.chdir(scratch)
+
+            bin_path, json_path = generate_data(config)
+            chart = load_chart_file(json_path, use_cache=False)
+            print(f"Synthetic chart: {len(chart.short_notes)} short notes, {len(chart.wyrm_notes)} wyrms, "
+                  f"{len(get_segment_beats(chart))} segments")
+
+            for stage in stages:
+                runs = []
+                for _ in range(repeat):
+                    with ProcessPoolExecutor(max_workers=1) as executor:
+                        runs.append(executor.submit(measure_stage, stage, bin_path, json_path).result())
+                walls = [run["wall"] for run in runs]
+                peaks = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+                results["stages"][stage] = {
+                    "wall": walls,
+                    "best": min(walls),
+                    "median": statistics.median(walls),
+                    "peak_rss_mb": max(peaks) if peaks else None,
+                }
+                print(f"{stage:<16}{statistics.median(walls):>10.3f} s{max(peaks) if peaks else float('nan'):>10.1f} MB")
+        finally:
+            os.chdir(cwd)
+    return results
+
+# prints the median time and peak memory of every stage against a previous results file
+def compare_results(results: dict, previous: dict):
+    print(f"{'stage':<16}{'before':>10}{'after':>10}{'change':>10}{'memory':>16}")
+    for stage, result in results["stages"].items():
+        if stage not in previous["stages"]:
+            continue
+        before, after = previous["stages"][stage], result
+        change = (after["median"] - before["median"]) / before["median"] * 100 if before["median"] else 0.0
+        memory = f"{before['peak_rss_mb']} -> {after['peak_rss_mb']}"
+        print(f"{stage:<16}{before['median']:>9.3f}s{after['median']:>9.3f}s{change:>+9.1f}%{memory:>16}")
+    if previous.get("config") != results["config"]:
+        print("WARNING: the runs used different synthetic chart settings")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--notes", type=int, default=2000, help="number of notes, wyrms included (default: 2000)")
+    parser.add_argument("-w", "--wyrm-ratio", type=float, default=0.1, help="share of notes that are wyrms (default: 0.1)")
+    parser.add_argument("-b", "--bpm-changes", type=int, default=4, help="number of bpm changes (default: 4)")
+    parser.add_argument("-v", "--vibes", type=int, default=6, help="number of vibe gains (default: 6)")
+    parser.add_argument("-e", "--enemies", type=int, default=8, help="number of different enemy sprites (default: 8)")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per stage, the median is compared (default: 3)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("-o", "--output", default="benchmark.json", help="results file (default: benchmark.json)")
+    parser.add_argument("-c", "--compare", help="previous results file to compare with")
+    args = parser.parse_args()
+
+    if args.notes < 1 or not 0 <= args.wyrm_ratio < 1 or args.repeat < 1:
+        parser.error("Notes and repeat should be positive, and wyrm ratio between 0 and 1.")
+    config = {"notes": args.notes, "wyrm_ratio": args.wyrm_ratio, "bpm_changes": args.bpm_changes,
+              "vibes": args.vibes, "enemies": args.enemies, "seed": args.seed}
+
+    results = run_benchmark(config, args.stages, args.repeat)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results saved as {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare_results(results, json.load(f))
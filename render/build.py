@@ -0,0 +1,118 @@
+import os, glob, traceback
+from functools import partial
+from rift_essentials import *
+from manifest import *
+from parse import parse_captures, get_json_path, get_parse_inputs, group_captures, read_chart_id, print_diagnostics_summary
+from get_vibe_from_csv import find_vibe_row, print_missing_vibe_rows
+from flatten import flatten_chart_variants, get_render_inputs
+from render_html import write_chart_html, get_chart_html_inputs, render_site_html
+from instrument import chart_scope, add_arguments, apply_arguments
+
+# Runs parse (with the vibe path) -> flatten -> html for every capture while holding the Chart in memory.
+# The chart JSON is written once, as an artifact, and every stage is recorded in the manifest
+# so that the standalone scripts agree on what is up to date.
+
+# returns the chart from its JSON if every stage built from the captures is up to date
+def load_fresh_chart(manifest: Manifest, files: list[str]) -> Chart:
+    inputs = get_parse_inputs(files)
+    if not all(manifest.is_fresh("parse", file, inputs) for file in files):
+        return None
+    
+    json_path = manifest.get_outputs("parse", files[0])[0]
+    chart = load_chart_file(json_path)
+    if (manifest.is_fresh("flatten", json_path, get_render_inputs(json_path)) and
+        manifest.is_fresh("html", json_path, get_chart_html_inputs(json_path))):
+        return chart
+    return None
+
+# builds file together with the other captures of its group
+def build_chart(file, jobs: int = 1, groups: dict[str, list[str]] = None) -> dict:
+    with chart_scope(read_chart_id(file), "build"):
+        return build_chart_stages(groups[file] if groups else [file], jobs)
+
+def build_chart_stages(files: list[str], jobs: int = 1) -> dict:
+    file = files[0]
+    try:
+        diagnostics: list[dict] = []
+        chart = parse_captures(files, diagnostics)
+        if chart is None:
+            return None
+        
+        json_path = get_json_path(chart)
+        save_chart(chart, json_path)
+        print(f"JSON data saved as {os.path.basename(json_path)}")
+
+        images = flatten_chart_variants(chart, (False, True), jobs=jobs)
+        html_path = write_chart_html(chart)
+        if not images or not html_path:
+            return None
+        
+        return {"chart": chart, "json": json_path, "images": images, "html": html_path, "diagnostics": diagnostics}
+    except Exception as e:
+        print(f"Build failed for file {file}: {e}")
+        traceback.print_exc()
+        return None
+
+# returns the parse diagnostics of every built chart that has any, by capture
+def build(bin_files: list[str], jobs: int, force: bool = False, segment_jobs: int = 1) -> dict[str, list[dict]]:
+    manifest = Manifest()
+    charts: dict[str, Chart] = {}
+
+    groups = group_captures(bin_files)
+    stale_files = []
+    for file, files in groups.items():
+        chart = None if force else load_fresh_chart(manifest, files)
+        if chart is None:
+            stale_files.append(file)
+        else:
+            print(f"Skipping up-to-date chart: {file}")
+            charts[manifest_key(get_json_path(chart))] = chart
+    
+    # either charts or segments are spread over the pool, never both. segments only on request,
+    # since every segment is sent back to be stitched
+    if len(stale_files) > 1:
+        results, _ = run_jobs(partial(build_chart, groups=groups), stale_files, jobs)
+    else:
+        results, _ = run_jobs(partial(build_chart, jobs=segment_jobs, groups=groups), stale_files, 1)
+    
+    diagnostics: dict[str, list[dict]] = {}
+    for file, result in results.items():
+        chart, json_path = result["chart"], result["json"]
+        if result["diagnostics"]:
+            diagnostics[file] = result["diagnostics"]
+        charts[manifest_key(json_path)] = chart
+        for member in groups[file]:
+            manifest.record("parse", member, get_parse_inputs(groups[file]), [json_path])
+        manifest.record("flatten", json_path, get_render_inputs(json_path), result["images"])
+        manifest.record("html", json_path, get_chart_html_inputs(json_path), [result["html"]])
+    
+    json_files = glob.glob(os.path.join(PATH_JSON, "*.json"))
+    render_site_html(json_files, manifest, force, charts)
+    manifest.save()
+    print_missing_vibe_rows([(chart.name, chart.difficulty) for chart in charts.values()
+                             if find_vibe_row(chart.name, chart.difficulty) is None])
+    print_diagnostics_summary(diagnostics)
+    return diagnostics
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-a", "--all", action="store_true")
+    group.add_argument("-i", "--input", nargs="+", help="captures to build, several captures of one chart are merged")
+    parser.add_argument("-f", "--force", action="store_true", help="force build even if chart is unchanged")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes, one chart each (default: core count)")
+    parser.add_argument("--segment-jobs", type=int, default=1, help="number of worker processes rendering segments when a single chart is built (default: 1)")
+    add_arguments(parser)
+    args = parser.parse_args()
+    apply_arguments(args)
+
+    if args.all:
+        bin_files = glob.glob(os.path.join(PATH_RAW, "*.bin"))
+        build(bin_files, args.jobs, args.force, args.segment_jobs)
+    else:
+        if not args.input:
+            parser.error("Should specify input. Type --help for more information.")
+        else:
+            build(args.input, args.jobs, args.force, args.segment_jobs)
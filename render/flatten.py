@@ -1,24 +1,51 @@
-import os, glob, json, math
+import os, glob, json, math, bisect, time, base64
+from collections import Counter, deque
 import traceback
+from functools import partial, lru_cache
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 from rift_essentials import *
+from manifest import *
+from png_stream import PngStripWriter
+from instrument import log, measure, is_tracing, chart_scope, get_chart_id, add_arguments, apply_arguments
 
 # DEBUG option
 DEBUG_COMBO     = False
 
+# render scale, every size constant is given in 1x units times the scale.
+# set_render_scale() renders natively at another scale; outputs of other scales get an @{scale}x suffix.
+DEFAULT_RENDER_SCALE = 4
+RENDER_SCALE    = DEFAULT_RENDER_SCALE
+
 # size constants
 # margin - gap - lane - gap - lane - gap - lane - gap - margin
-LANE_WIDTH      = 16*4
-LANE_GAP        = 1*4
-LANE_MARGIN     = 42*4
-LANE_HEIGHT     = 1200*4
-LANE_PADDING    = 8*4           # slightly longer lanes for previewing next notes
-NOTE_SIZE       = 12*4
-NOTE_THICK      = 2*4
-FONT_SIZE       = 12*4
-FONT_MARGIN     = 4*4           # also applies to vibe indicators
-WYRM_HEAD_SIZE  = 6*4           # wyrm head (triangle) height
-VIBE_IND_SIZE   = 12*4          # vibe indicator (triagnle pointing right)'s width & height
+LANE_WIDTH      = 16*RENDER_SCALE
+LANE_GAP        = 1*RENDER_SCALE
+LANE_MARGIN     = 42*RENDER_SCALE
+LANE_HEIGHT     = 1200*RENDER_SCALE
+LANE_PADDING    = 8*RENDER_SCALE  # slightly longer lanes for previewing next notes
+NOTE_SIZE       = 12*RENDER_SCALE
+NOTE_THICK      = 2*RENDER_SCALE
+FONT_SIZE       = 12*RENDER_SCALE
+FONT_MARGIN     = 4*RENDER_SCALE  # also applies to vibe indicators
+WYRM_HEAD_SIZE  = 6*RENDER_SCALE  # wyrm head (triangle) height
+VIBE_IND_SIZE   = 12*RENDER_SCALE # vibe indicator (triagnle pointing right)'s width & height
+SCALED_SIZES    = ("LANE_WIDTH", "LANE_GAP", "LANE_MARGIN", "LANE_HEIGHT", "LANE_PADDING", "NOTE_SIZE",
+                   "NOTE_THICK", "FONT_SIZE", "FONT_MARGIN", "WYRM_HEAD_SIZE", "VIBE_IND_SIZE")
+
+# rescales every size constant. worker processes are started with it as initializer,
+# so they render at the scale of the parent process.
+def set_render_scale(scale: int):
+    global RENDER_SCALE
+    if scale < 1:
+        raise ValueError(f"render scale must be a positive integer, not {scale}")
+    for name in SCALED_SIZES:
+        globals()[name] = globals()[name] // RENDER_SCALE * scale
+    RENDER_SCALE = scale
+
+# file name suffix of outputs rendered at a non-default scale
+def get_scale_suffix() -> str:
+    return "" if RENDER_SCALE == DEFAULT_RENDER_SCALE else f"@{RENDER_SCALE}x"
 
 # color constants
 BG_COLOR        = (0,0,0)       # black
@@ -34,61 +61,255 @@ NOTE_COLOR      = (255,255,255) # white
 OVERLAP_COLOR   = (255,0,0)     # red
 VIBE_COLOR      = (255,255,0)   # yellow
 
-def create_segment(beat_index: int, chart: Chart, render_enemies: bool):
+# fonts and resized enemy sprites are loaded once per process and reused by every segment
+@lru_cache(maxsize=None)
+def load_font(font_name: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(font_name, size)
+
+@lru_cache(maxsize=None)
+def load_enemy_sprite(enemy_type: EnemyType, size: int) -> Image.Image:
+    enemy_img_path = os.path.join(PATH_ENEMIES, f"{enemy_type.name.lower()}.png")
+    with Image.open(enemy_img_path) as enemy_img:
+        return enemy_img.convert("RGBA").resize((size, size), Image.LANCZOS)
+
+# beat-sorted lookup of notes, built once per chart and shared by every segment
+class NoteIndex():
+    def __init__(self, chart: Chart):
+        self.short_notes: list[Note] = sorted(chart.short_notes, key=lambda note: note.beat_start)
+        self.short_beats: list[float] = [note.beat_start for note in self.short_notes]
+
+        # notes sharing both column and beat are overlapped, counted in a single pass
+        counts = Counter((note.column, note.beat_start) for note in self.short_notes)
+        self.overlapped: list[bool] = [counts[(note.column, note.beat_start)] > 1 for note in self.short_notes]
+
+        self.wyrm_notes: list[Note] = sorted(chart.wyrm_notes, key=lambda note: note.beat_start)
+        self.wyrm_beats: list[float] = [note.beat_start for note in self.wyrm_notes]
+        # any wyrm reaching into a window starts at most max_wyrm_length before it
+        self.max_wyrm_length: float = max((note.beat_finish - note.beat_start for note in self.wyrm_notes), default=0.0)
+        self.max_wyrm_length = max(self.max_wyrm_length, 0.0)
+
+    # short notes with beat_from <= beat_start <= beat_to, paired with their overlap flag
+    def get_short_notes(self, beat_from: float, beat_to: float) -> list[tuple[Note, bool]]:
+        index_from = bisect.bisect_left(self.short_beats, beat_from)
+        index_to = bisect.bisect_right(self.short_beats, beat_to)
+        return list(zip(self.short_notes[index_from:index_to], self.overlapped[index_from:index_to]))
+
+    # wyrms whose span [beat_start, beat_finish] touches [beat_from, beat_to]
+    def get_wyrm_notes(self, beat_from: float, beat_to: float) -> list[Note]:
+        index_from = bisect.bisect_left(self.wyrm_beats, beat_from - self.max_wyrm_length)
+        index_to = bisect.bisect_right(self.wyrm_beats, beat_to)
+        return [note for note in self.wyrm_notes[index_from:index_to]
+                if note.beat_start >= beat_from or note.beat_finish >= beat_from]
+
+# segment layout, shared by every drawing backend
+def get_segment_size() -> tuple[int, int]:
     width               = LANE_MARGIN * 2 + LANE_WIDTH * 3 + LANE_GAP * 4
     height              = LANE_HEIGHT + LANE_PADDING * 2 + LANE_MARGIN * 2
-    height_lane_start   = LANE_HEIGHT + LANE_PADDING + LANE_MARGIN          # height of lane start, excluding padding
-    height_lane_end     = LANE_PADDING + LANE_MARGIN                        # height of lane end,   excluding padding
+    return width, height
 
-    short_notes = chart.short_notes
-    wyrm_notes = chart.wyrm_notes
-    
-    # function that calcs x,y coordinate
-    def get_note_xy(column: int, rel_beat: float):
-        NOTE_MARGIN = (LANE_WIDTH - NOTE_SIZE) / 2
-        x = LANE_MARGIN + LANE_GAP * (column + 1) + LANE_WIDTH * column + NOTE_MARGIN
-        
-        BEAT_HEIGHT = LANE_HEIGHT / 16
-        y = height_lane_start - (BEAT_HEIGHT) * rel_beat
-        
-        return x, y
+# height of lane start, excluding padding
+def get_lane_start() -> int:
+    return LANE_HEIGHT + LANE_PADDING + LANE_MARGIN
+
+# height of lane end, excluding padding
+def get_lane_end() -> int:
+    return LANE_PADDING + LANE_MARGIN
+
+def get_beat_y(rel_beat: float):
+    BEAT_HEIGHT = LANE_HEIGHT / 16
+    return get_lane_start() - (BEAT_HEIGHT) * rel_beat
+
+# function that calcs x,y coordinate
+def get_note_xy(column: int, rel_beat: float):
+    NOTE_MARGIN = (LANE_WIDTH - NOTE_SIZE) / 2
+    x = LANE_MARGIN + LANE_GAP * (column + 1) + LANE_WIDTH * column + NOTE_MARGIN
+    return x, get_beat_y(rel_beat)
+
+# drawing backends. the segment drawing code only calls these, so every backend gets the same layout.
+# - RasterCanvas draws on a PIL image, offset draws a segment straight into a whole chart image
+# - SvgCanvas collects SVG elements; segments reuse the static background and enemy sprites through <use>
+# - CanvasGroup draws the shared layers on one canvas per variant, split() hands them out for the notes
+class RasterCanvas():
+    def __init__(self, img: Image.Image, offset: int = 0):
+        self.img = img
+        self.offset = offset
+        self.draw = ImageDraw.Draw(img)
+
+    @staticmethod
+    def create_segment():
+        return RasterCanvas(create_segment_base(RENDER_SCALE).copy())
+
+    def rectangle(self, xy: list[float], color: tuple):
+        x0, y0, x1, y1 = xy
+        self.draw.rectangle([x0 + self.offset, y0, x1 + self.offset, y1], fill=color)
+
+    def polygon(self, vertices: list[tuple[float, float]], color: tuple):
+        self.draw.polygon([(x + self.offset, y) for x, y in vertices], fill=color)
+
+    def text(self, x: float, y: float, text: str, color: tuple, align_right: bool = False, bold: bool = True):
+        font = load_font("arialbd.ttf" if bold else "arial.ttf", FONT_SIZE)
+        if align_right:
+            _, _, text_width, _ = font.getbbox(text)
+            x -= text_width
+        self.draw.text((x + self.offset,y), text, fill=color, font=font)
+
+    def sprite(self, enemy_type: EnemyType, x: float, y: float):
+        enemy_img = load_enemy_sprite(enemy_type, NOTE_SIZE)
+        self.img.paste(enemy_img, (int(x) + self.offset, int(y) - NOTE_SIZE // 2), enemy_img)
+
+    def fork(self):
+        return RasterCanvas(self.img.copy(), self.offset)
+
+    # one canvas per variant, the last one reuses this canvas
+    def split(self, count: int) -> list:
+        return [self.fork() for _ in range(count - 1)] + [self]
+
+    def result(self) -> Image.Image:
+        return self.img
+
+SVG_FONT_ASCENT = 0.905         # arial ascender in em, PIL draws text from the ascender line
+
+def get_svg_color(color: tuple) -> str:
+    return "#{:02x}{:02x}{:02x}".format(*color)
+
+def get_svg_number(value: float) -> str:
+    return f"{round(value, 2):g}"
+
+class SvgCanvas():
+    def __init__(self, elements: list[str] = None):
+        self.elements: list[str] = elements if elements is not None else []
+
+    @staticmethod
+    def create_segment():
+        return SvgCanvas(['<use href="#segment-base"/>'])
+
+    # PIL rectangles include their last row and column
+    def rectangle(self, xy: list[float], color: tuple):
+        x0, y0, x1, y1 = xy
+        self.elements.append(f'<rect x="{get_svg_number(x0)}" y="{get_svg_number(y0)}" '
+                             f'width="{get_svg_number(x1 - x0 + 1)}" height="{get_svg_number(y1 - y0 + 1)}" fill="{get_svg_color(color)}"/>')
+
+    def polygon(self, vertices: list[tuple[float, float]], color: tuple):
+        points = " ".join(f"{get_svg_number(x)},{get_svg_number(y)}" for x, y in vertices)
+        self.elements.append(f'<polygon points="{points}" fill="{get_svg_color(color)}"/>')
+
+    def text(self, x: float, y: float, text: str, color: tuple, align_right: bool = False, bold: bool = True):
+        self.elements.append(f'<text x="{get_svg_number(x)}" y="{get_svg_number(y + FONT_SIZE * SVG_FONT_ASCENT)}" '
+                             f'fill="{get_svg_color(color)}"' + (' text-anchor="end"' if align_right else '') +
+                             ('' if bold else ' font-weight="normal"') + f'>{text}</text>')
+
+    def sprite(self, enemy_type: EnemyType, x: float, y: float):
+        self.elements.append(f'<use href="#enemy-{enemy_type.name.lower()}" x="{int(x)}" y="{int(y) - NOTE_SIZE // 2}" '
+                             f'width="{NOTE_SIZE}" height="{NOTE_SIZE}"/>')
+
+    def fork(self):
+        return SvgCanvas(list(self.elements))
+
+    def split(self, count: int) -> list:
+        return [self.fork() for _ in range(count - 1)] + [self]
+
+    def result(self) -> str:
+        return "\n".join(self.elements)
+
+class CanvasGroup():
+    def __init__(self, canvases: list):
+        self.canvases = canvases
+
+    def rectangle(self, xy: list[float], color: tuple):
+        for canvas in self.canvases:
+            canvas.rectangle(xy, color)
+
+    def polygon(self, vertices: list[tuple[float, float]], color: tuple):
+        for canvas in self.canvases:
+            canvas.polygon(vertices, color)
 
-    # prepare canvas
-    img = Image.new("RGBA", (width, height), BG_COLOR)
-    draw = ImageDraw.Draw(img)
+    def text(self, x: float, y: float, text: str, color: tuple, align_right: bool = False, bold: bool = True):
+        for canvas in self.canvases:
+            canvas.text(x, y, text, color, align_right, bold)
+
+    def sprite(self, enemy_type: EnemyType, x: float, y: float):
+        for canvas in self.canvases:
+            canvas.sprite(enemy_type, x, y)
+
+    def split(self, count: int) -> list:
+        if count != len(self.canvases):
+            raise ValueError(f"{len(self.canvases)} canvases cannot be split into {count} variants")
+        return self.canvases
+
+# static background of every segment: lanes, beat divisions and gaps.
+# it is drawn once and reused by every segment; texts, vibe markers and notes go on top.
+# none of the texts or markers overlap the lanes, so drawing them after the divisions changes no pixel.
+def draw_segment_base(canvas):
+    height_lane_start   = get_lane_start()
+    height_lane_end     = get_lane_end()
     
     # draw lanes
     x_start = LANE_MARGIN + LANE_GAP
     for _ in range(3):
-        draw.rectangle([x_start,
-                        height_lane_end - LANE_PADDING,
-                        x_start + LANE_WIDTH,
-                        height_lane_start + LANE_PADDING],
-                        fill=LANE_COLOR)
+        canvas.rectangle([x_start,
+                          height_lane_end - LANE_PADDING,
+                          x_start + LANE_WIDTH,
+                          height_lane_start + LANE_PADDING],
+                          LANE_COLOR)
         x_start += LANE_WIDTH + LANE_GAP
     
-    # function that renders text
-    def render_text(x: float, y: float, text: str, color: tuple, align_right: bool = False):
-        font = ImageFont.truetype("arialbd.ttf", FONT_SIZE)
-        if align_right:
-            _, _, text_width, _ = font.getbbox(text)
-            x -= text_width
-        draw.text((x,y), text, fill=color, font=font)
-    
     # draw beat divisions
-    # - main division & beat count texts
+    # - main division
+    for rel_beat in range(0,17,4):
+        y_finish = get_beat_y(rel_beat)
+        canvas.rectangle([LANE_MARGIN,
+                          y_finish - LANE_GAP,
+                          LANE_MARGIN + LANE_WIDTH * 3 + LANE_GAP * 4,
+                          y_finish],
+                          MAIN_DIV_COLOR)
+    
+    # - sub division
+    for rel_beat in range(17):
+        if rel_beat % 4 != 0:
+            y_finish = get_beat_y(rel_beat)
+            canvas.rectangle([LANE_MARGIN,
+                              y_finish - LANE_GAP,
+                              LANE_MARGIN + LANE_WIDTH * 3 + LANE_GAP * 4,
+                              y_finish],
+                              SUB_DIV_COLOR)
+    
+    # draw gaps
+    x_start = LANE_MARGIN
+    for _ in range(4):
+        canvas.rectangle([x_start, height_lane_end - LANE_PADDING, x_start + LANE_GAP, height_lane_start + LANE_PADDING], GAP_COLOR)
+        x_start += LANE_GAP + LANE_WIDTH
+
+# raster background, drawn once per process and scale, and copied by every segment
+@lru_cache(maxsize=None)
+def create_segment_base(scale: int) -> Image.Image:
+    img = Image.new("RGBA", get_segment_size(), BG_COLOR)
+    draw_segment_base(RasterCanvas(img))
+    return img
+
+def create_segment(beat_index: int, chart: Chart, render_enemies: bool, note_index: NoteIndex = None):
+    return create_segment_variants(beat_index, chart, (render_enemies,), note_index)[0]
+
+# renders one segment per variant (render_enemies flag) in a single pass.
+# everything up to the wyrms is shared; the canvas forks only for the short notes,
+# because enemy sprites are pasted in between them.
+# canvas_type picks the drawing backend: PIL images for RasterCanvas, SVG fragments for SvgCanvas.
+# a given canvas is drawn on instead, it must already hold the static background.
+def create_segment_variants(beat_index: int, chart: Chart, variants: tuple[bool, ...] = (False, True), note_index: NoteIndex = None, canvas_type = RasterCanvas, canvas = None) -> list:
+    if note_index is None:
+        note_index = NoteIndex(chart)
+
+    # prepare canvas, starting from the static background
+    if canvas is None:
+        canvas = canvas_type.create_segment()
+    
+    # draw beat count texts
     optimal_vibe_beats: list[float] = [vibe.beat for vibe in chart.optimal_vibes]
     for rel_beat in range(0,17,4):
         _, y_finish = get_note_xy(0, rel_beat)
-        draw.rectangle([LANE_MARGIN,
-                        y_finish - LANE_GAP,
-                        LANE_MARGIN + LANE_WIDTH * 3 + LANE_GAP * 4,
-                        y_finish],
-                        fill=MAIN_DIV_COLOR)
         
         act_beat = rel_beat + beat_index # actual beat
         if not act_beat in optimal_vibe_beats: # only render beat texts if it's not in vibe
-            render_text(LANE_MARGIN - FONT_MARGIN, y_finish - LANE_GAP - FONT_SIZE,
+            canvas.text(LANE_MARGIN - FONT_MARGIN, y_finish - LANE_GAP - FONT_SIZE,
                         f"{(beat_index+rel_beat):03d}",
                         FONT_MEASURE_COLOR,
                         align_right=True)
@@ -105,28 +326,12 @@ def create_segment(beat_index: int, chart: Chart, render_enemies: bool):
                 (LANE_MARGIN - FONT_MARGIN - VIBE_IND_SIZE, y_start + VIBE_IND_SIZE // 2),
                 (LANE_MARGIN - FONT_MARGIN - VIBE_IND_SIZE, y_start - VIBE_IND_SIZE // 2)
             ]
-        draw.polygon(vertices, fill=VIBE_COLOR)
-        render_text(LANE_MARGIN - FONT_MARGIN, y_start - FONT_SIZE // 2 - VIBE_IND_SIZE - FONT_MARGIN,
+        canvas.polygon(vertices, VIBE_COLOR)
+        canvas.text(LANE_MARGIN - FONT_MARGIN, y_start - FONT_SIZE // 2 - VIBE_IND_SIZE - FONT_MARGIN,
                     f"{vibe_beat:06.2f}",
                     VIBE_COLOR,
                     align_right=True)
     
-    # - sub division
-    for rel_beat in range(17):
-        if rel_beat % 4 != 0:
-            _, y_finish = get_note_xy(0, rel_beat)
-            draw.rectangle([LANE_MARGIN,
-                            y_finish - LANE_GAP,
-                            LANE_MARGIN + LANE_WIDTH * 3 + LANE_GAP * 4,
-                            y_finish],
-                            fill=SUB_DIV_COLOR)
-    
-    # draw gaps
-    x_start = LANE_MARGIN
-    for _ in range(4):
-        draw.rectangle([x_start, height_lane_end - LANE_PADDING, x_start + LANE_GAP, height_lane_start + LANE_PADDING], fill=GAP_COLOR)
-        x_start += LANE_GAP + LANE_WIDTH
-    
     # draw bpm change texts
     base_bpm = chart.base_bpm
     bpm_changes = chart.bpm_changes
@@ -137,22 +342,22 @@ def create_segment(beat_index: int, chart: Chart, render_enemies: bool):
             continue
         
         _, y_finish = get_note_xy(0, rel_beat)
-        render_text(BPM_TEXT_X_START + FONT_MARGIN, y_finish - LANE_GAP - FONT_SIZE,
+        canvas.text(BPM_TEXT_X_START + FONT_MARGIN, y_finish - LANE_GAP - FONT_SIZE,
                     f"{bpm_change.bpm}",
                     FONT_BPM_COLOR)
     
     # filter only in-range notes
     beat_from = beat_index
     beat_to = beat_index + 16
-    filtered_short_notes = list(filter(lambda note: beat_from <= note.beat_start <= beat_to, short_notes))
-    filtered_wyrm_notes = list(filter(lambda note: (beat_from <= note.beat_start <= beat_to) or (beat_from <= note.beat_finish <= beat_to), wyrm_notes))
+    filtered_short_notes = note_index.get_short_notes(beat_from, beat_to)
+    filtered_wyrm_notes = note_index.get_wyrm_notes(beat_from, beat_to)
     
     # function for rendering wyrm body
     def render_wyrm_body(column: int, rel_beat_start: float, rel_beat_finish: float):
         x_start, y_start  = get_note_xy(column, rel_beat_start)
         _      , y_finish = get_note_xy(column, rel_beat_finish)
         
-        draw.rectangle([x_start, y_finish, x_start + NOTE_SIZE, y_start], fill=WYRM_BODY_COLOR)
+        canvas.rectangle([x_start, y_finish, x_start + NOTE_SIZE, y_start], WYRM_BODY_COLOR)
     
     # function for rendering wyrm head
     def render_wyrm_head(column: int, rel_beat: float, color: tuple):
@@ -165,21 +370,16 @@ def create_segment(beat_index: int, chart: Chart, render_enemies: bool):
                 (x_start + NOTE_SIZE/2, y_start - WYRM_HEAD_SIZE)
             ]
 
-            draw.polygon(vertices, fill=color)
+            canvas.polygon(vertices, color)
         else:
             render_short_note(column, rel_beat, color, EnemyType.WYRM)
 
     # function for rendering short notes
     def render_short_note(column: int, rel_beat: float, color: tuple, enemy_type: EnemyType = EnemyType.NONE):
         x_start, y_start = get_note_xy(column, rel_beat)
-        draw.rectangle([x_start, y_start - NOTE_THICK, x_start + NOTE_SIZE, y_start], fill=color)
+        canvas.rectangle([x_start, y_start - NOTE_THICK, x_start + NOTE_SIZE, y_start], color)
         if render_enemies:
-            enemy_img_path = os.path.join(PATH_ENEMIES, f"{enemy_type.name.lower()}.png")
-            enemy_img = Image.open(enemy_img_path).convert("RGBA")
-            enemy_img = enemy_img.resize((NOTE_SIZE, NOTE_SIZE), Image.LANCZOS)
-
-            x_start, y_start = get_note_xy(column, rel_beat)
-            img.paste(enemy_img, (int(x_start), int(y_start) - NOTE_SIZE // 2), enemy_img)
+            canvas.sprite(enemy_type, x_start, y_start)
     
     # function for determining if a note is in vibe state
     ## BUG : currently CSV files contain wrong combo values.
@@ -197,9 +397,8 @@ def create_segment(beat_index: int, chart: Chart, render_enemies: bool):
     # DEBUG function, that renders combo count text on every note
     def render_combo_text(column: int, rel_beat: float, combo: int):
         x_start, y_start = get_note_xy(column, rel_beat)
-        font = ImageFont.truetype("arial.ttf", FONT_SIZE)
         COLOR_WHITE = (255,255,255)
-        draw.text((x_start, y_start - FONT_SIZE), f"{combo}", fill=COLOR_WHITE, font=font)
+        canvas.text(x_start, y_start - FONT_SIZE, f"{combo}", COLOR_WHITE, bold=False)
     
     # render wyrm notes
     for note in filtered_wyrm_notes:
@@ -217,80 +416,431 @@ def create_segment(beat_index: int, chart: Chart, render_enemies: bool):
             if DEBUG_COMBO:
                 render_combo_text(note.column, relative_beat_start, note.combo)
     
-    # render short notes
+    # render short notes, forking the shared canvas per variant
     # vibe_data = data['vibe']
-    for note in filtered_short_notes:
-        relative_beat = note.beat_start - beat_index
-
-        color = (0,0,0)
+    segments = []
+    for canvas, render_enemies in zip(canvas.split(len(variants)), variants):
         
-        overlap_count: int = 0
-        for other_note in filtered_short_notes:
-            if note.column == other_note.column and note.beat_start == other_note.beat_start:
-                overlap_count += 1
-        
-        color = NOTE_COLOR if overlap_count == 1 else OVERLAP_COLOR
-        render_short_note(note.column, relative_beat, color, note.enemy_type)
+        for note, overlapped in filtered_short_notes:
+            relative_beat = note.beat_start - beat_index
 
-        if DEBUG_COMBO:
-            render_combo_text(note.column, relative_beat, note.combo)
-    
-    return img
+            color = NOTE_COLOR if not overlapped else OVERLAP_COLOR
+            render_short_note(note.column, relative_beat, color, note.enemy_type)
 
-def flatten(file, render_enemies: bool):
-    if DEBUG_COMBO:
-        print("WARNING: COMBO_DEBUG option is True")
+            if DEBUG_COMBO:
+                render_combo_text(note.column, relative_beat, note.combo)
+        
+        segments.append(canvas.result())
+    
+    return segments
 
+def flatten(file, render_enemies: bool, jobs: int = 1, output: str = "image") -> str:
     try:
-        with open(file, 'r') as f:
-            data = json.load(f)
+        chart = load_chart_file(file)
     except Exception as e:
         print(f"Failed JSON open on {file}: {e}")
         traceback.print_exc()
-        return
-        
-    chart = load_chart(data)
+        return None
     
-    name = chart.name
-    difficulty = chart.difficulty
+    return flatten_chart(chart, render_enemies, jobs, output)
+
+# first beat of every 16-beat segment of a chart
+def get_segment_beats(chart: Chart) -> range:
     short_notes, wyrm_notes = chart.short_notes, chart.wyrm_notes
     
     last_beat: float = 0.0
     last_beat = max(short_notes[-1].beat_start, max(note.beat_finish for note in wyrm_notes) if len(wyrm_notes) != 0 else 0)
     last_beat = int(math.ceil(last_beat/16)*16)
     
-    try:
-        img_segments = []
-        for beat_start in range(1, last_beat+1, 16):
-            img_segments.append(create_segment(beat_start, chart, render_enemies))
+    return range(1, last_beat+1, 16)
+
+# yields, in order, the 16-beat segments of a chart as one image (or SVG fragment) per variant.
+# segments are independent, so they can be rendered on a process pool; at most jobs*2 of them are
+# in flight or waiting at a time, so streaming outputs stay bounded in memory.
+def render_segments(chart: Chart, variants: tuple[bool, ...], jobs: int = 1, canvas_type = RasterCanvas):
+    beat_starts = get_segment_beats(chart)
+    note_index = NoteIndex(chart)
+    if jobs > 1 and len(beat_starts) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=set_render_scale, initargs=(RENDER_SCALE,)) as executor:
+            pending = deque()
+            for beat_start in beat_starts:
+                pending.append(executor.submit(create_segment_variants, beat_start, chart, variants, note_index, canvas_type))
+                if len(pending) >= jobs * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    else:
+        for beat_start in beat_starts:
+            yield create_segment_variants(beat_start, chart, variants, note_index, canvas_type)
+
+# output encoders. level is the encoder's speed/size trade-off, None keeps the encoder default.
+# - png:     truecolor PNG, level is the zlib level 0-9 (default 6)
+# - palette: 16-color PNG of the color constants for the plain chart, level as png. antialiased edges
+#            snap to the nearest constant color; enemy sprites have too many colors, so enemy images
+#            stay truecolor PNG.
+# - webp:    lossless WebP, level is the method 0-6 (default 4). WebP images are at most 16383 pixels
+#            per side, so it only fits the tiles and pyramid outputs.
+IMAGE_ENCODERS  = ["png", "palette", "webp"]
+WEBP_MAX_SIZE   = 16383
+
+# every *_COLOR constant, padded with the background to 16 entries so PNG packs 4 bits per pixel
+@lru_cache(maxsize=None)
+def get_chart_palette() -> Image.Image:
+    colors = sorted({value for name, value in globals().items() if name.endswith("_COLOR")})
+    colors += [BG_COLOR] * (16 - len(colors))
+    palette = Image.new("P", (1, 1))
+    palette.putpalette([channel for color in colors for channel in color])
+    return palette
+
+class ImageEncoder():
+    def __init__(self, name: str = "png", level: int = None):
+        if name not in IMAGE_ENCODERS:
+            raise ValueError(f"unknown image encoder: {name}")
+        self.name = name
+        self.level = level
+        self.extension = "webp" if name == "webp" else "png"
+
+    def save(self, img: Image.Image, path, render_enemies: bool):
+        if self.name == "webp":
+            if max(img.size) > WEBP_MAX_SIZE:
+                raise ValueError(f"{img.width}x{img.height} image exceeds the WebP size limit of {WEBP_MAX_SIZE}")
+            img.save(path, "WEBP", lossless=True, method=4 if self.level is None else self.level)
+            return
         
-        total_width = sum(img.width for img in img_segments)
-        max_height = max(img.height for img in img_segments)
+        if self.name == "palette" and not render_enemies:
+            img = img.convert("RGB").quantize(palette=get_chart_palette(), dither=Image.Dither.NONE)
+        img.save(path, "PNG", compress_level=6 if self.level is None else self.level)
+
+    def __repr__(self):
+        return f"{self.name}" if self.level is None else f"{self.name}:{self.level}"
+
+# renders whole chart images, one per variant, drawing every segment straight into them.
+# this skips the per-segment canvas copies and the stitching, and never holds the segments and
+# the chart at once. texts can reach past a segment's edges, where a standalone segment clips them:
+# - segments are drawn right to left and every background is pasted right before its segment,
+#   so long vibe labels reaching left are covered
+# - the left margin of the segment on the right is restored afterwards, for labels reaching right
+def render_chart_images(chart: Chart, variants: tuple[bool, ...]) -> list[Image.Image]:
+    beat_starts = get_segment_beats(chart)
+    note_index = NoteIndex(chart)
+    width, height = get_segment_size()
+    base = create_segment_base(RENDER_SCALE)
+
+    images = [Image.new("RGB", (width * len(beat_starts), height)) for _ in variants]
+    for index in reversed(range(len(beat_starts))):
+        x = index * width
+        canvases = []
+        margins = []
+        for img in images:
+            img.paste(base, (x, 0))
+            margins.append(img.crop((x + width, 0, x + width + LANE_MARGIN, height)) if index + 1 < len(beat_starts) else None)
+            canvases.append(RasterCanvas(img, x))
+        create_segment_variants(beat_starts[index], chart, variants, note_index, canvas=CanvasGroup(canvases))
+        for img, margin in zip(images, margins):
+            if margin is not None:
+                img.paste(margin, (x + width, 0))
+    return images
+
+# deep-zoom tile pyramid
+# level 0 is the full image, every next level halves it until it fits in one tile row.
+# tiles are saved as {level}/{column}_{row}.{extension} and described in pyramid.json for the chart viewer.
+PYRAMID_TILE_SIZE = 512
+
+def save_pyramid(img: Image.Image, directory, encoder: ImageEncoder = None, render_enemies: bool = False) -> str:
+    encoder = encoder or ImageEncoder()
+    levels = []
+    level_img = img
+    while True:
+        level = len(levels)
+        columns = math.ceil(level_img.width / PYRAMID_TILE_SIZE)
+        rows = math.ceil(level_img.height / PYRAMID_TILE_SIZE)
+        os.makedirs(os.path.join(directory, f"{level}"), exist_ok=True)
+        for column in range(columns):
+            for row in range(rows):
+                x, y = column * PYRAMID_TILE_SIZE, row * PYRAMID_TILE_SIZE
+                tile = level_img.crop((x, y, min(x + PYRAMID_TILE_SIZE, level_img.width), min(y + PYRAMID_TILE_SIZE, level_img.height)))
+                encoder.save(tile, os.path.join(directory, f"{level}", f"{column}_{row}.{encoder.extension}"), render_enemies)
+        levels.append({"width": level_img.width, "height": level_img.height, "columns": columns, "rows": rows})
+
+        if level_img.height <= PYRAMID_TILE_SIZE:
+            break
+        level_img = level_img.reduce(2)
+    
+    pyramid_path = os.path.join(directory, "pyramid.json")
+    with open(pyramid_path, "w", encoding="utf-8") as f:
+        json.dump({"tile_size": PYRAMID_TILE_SIZE, "format": encoder.extension, "levels": levels}, f, indent=4)
+    return pyramid_path
+
+# output modes. every output takes segments left to right with add(), and close() returns the saved file name.
+# - image:   stitch every segment into one image, then save it (fastest, holds the whole chart in memory)
+# - stream:  encode the PNG left to right while segments are produced, one segment in memory (png encoder only)
+# - tiles:   save every segment as its own image, listed in tiles.json
+# - pyramid: stitch the image, then save it as a deep-zoom tile pyramid, described in pyramid.json
+# - svg:     vector chart, every segment placed next to the previous one (ignores the encoder)
+# canvas_type is the drawing backend the output takes its segments from.
+# encode_seconds is the time an output spent writing segments out as they were added, before close:
+# tiles are encoded there, the stream only spools raw rows and compresses them in close.
+class ImageOutput():
+    canvas_type = RasterCanvas
+    encode_seconds = 0.0
+
+    def __init__(self, file_hierarchy: str, file_name: str, encoder: ImageEncoder, render_enemies: bool):
+        self.file_hierarchy = file_hierarchy
+        self.file_name = file_name
+        self.encoder = encoder
+        self.render_enemies = render_enemies
+        self.img_segments: list[Image.Image] = []
+        self.img: Image.Image = None
+
+    def add(self, img_segment: Image.Image):
+        self.img_segments.append(img_segment)
+
+    # whole chart image from render_chart_images, used instead of the segments
+    def set_image(self, img: Image.Image):
+        self.img = img
+
+    def stitch(self) -> Image.Image:
+        if self.img is not None:
+            return self.img
+        
+        with measure("stitch", segments=len(self.img_segments)):
+            return self.stitch_segments()
+
+    def stitch_segments(self) -> Image.Image:
+        # segments come in order, so the stitched image is identical to a serial render.
+        total_width = sum(img.width for img in self.img_segments)
+        max_height = max(img.height for img in self.img_segments)
         
         img = Image.new("RGB", (total_width, max_height))
         
         current_x = 0
-        for img_segment in img_segments:
+        for img_segment in self.img_segments:
             img.paste(img_segment, (current_x, 0))
             current_x += img_segment.width
-    except Exception as e:
-        print(f"Failed image creating on {name}_{difficulty.name.lower()}: {e}")
-        traceback.print_exc()
-        return
+        self.img_segments = []
+        return img
+
+    def close(self) -> str:
+        file_name = f"{self.file_name}.{self.encoder.extension}"
+        self.encoder.save(self.stitch(), os.path.join(self.file_hierarchy, file_name), self.render_enemies)
+        return file_name
+
+class PyramidOutput(ImageOutput):
+    def close(self) -> str:
+        file_name = f"{self.file_name}_pyramid/pyramid.json"
+        save_pyramid(self.stitch(), os.path.join(self.file_hierarchy, os.path.dirname(file_name)), self.encoder, self.render_enemies)
+        return file_name
+
+class StreamOutput():
+    canvas_type = RasterCanvas
+    encode_seconds = 0.0
+
+    def __init__(self, file_hierarchy: str, file_name: str, encoder: ImageEncoder, render_enemies: bool):
+        if encoder.name != "png":
+            raise ValueError(f"stream output only supports the png encoder, not {encoder.name}")
+        self.file_name = f"{file_name}.png"
+        self.writer = PngStripWriter(os.path.join(file_hierarchy, self.file_name), 6 if encoder.level is None else encoder.level)
+
+    def add(self, img_segment: Image.Image):
+        start_time = time.perf_counter()
+        self.writer.add(img_segment)
+        self.encode_seconds += time.perf_counter() - start_time
+
+    def close(self) -> str:
+        self.writer.close()
+        return self.file_name
+
+class TilesOutput():
+    canvas_type = RasterCanvas
+    encode_seconds = 0.0
+
+    def __init__(self, file_hierarchy: str, file_name: str, encoder: ImageEncoder, render_enemies: bool):
+        self.file_hierarchy = file_hierarchy
+        self.file_name = file_name
+        self.encoder = encoder
+        self.render_enemies = render_enemies
+        self.tiles: list[dict] = []
+        os.makedirs(os.path.join(file_hierarchy, f"{file_name}_tiles"), exist_ok=True)
+
+    def add(self, img_segment: Image.Image):
+        tile_name = f"{len(self.tiles):03d}.{self.encoder.extension}"
+        start_time = time.perf_counter()
+        self.encoder.save(img_segment.convert("RGB"), os.path.join(self.file_hierarchy, f"{self.file_name}_tiles", tile_name), self.render_enemies)
+        self.encode_seconds += time.perf_counter() - start_time
+        self.tiles.append({"file": tile_name, "width": img_segment.width, "height": img_segment.height})
+
+    def close(self) -> str:
+        file_name = f"{self.file_name}_tiles/tiles.json"
+        with open(os.path.join(self.file_hierarchy, file_name), "w", encoding="utf-8") as f:
+            json.dump({"tiles": self.tiles}, f, indent=4)
+        return file_name
+
+class SvgOutput():
+    canvas_type = SvgCanvas
+    encode_seconds = 0.0
+
+    def __init__(self, file_hierarchy: str, file_name: str, encoder: ImageEncoder, render_enemies: bool):
+        self.file_hierarchy = file_hierarchy
+        self.file_name = file_name
+        self.segments: list[str] = []
+
+    def add(self, segment: str):
+        self.segments.append(segment)
+
+    def close(self) -> str:
+        segment_width, height = get_segment_size()
+        width = segment_width * len(self.segments)
+        body = "\n".join(f'<g transform="translate({index * segment_width},0)">\n{segment}\n</g>'
+                          for index, segment in enumerate(self.segments))
+
+        # the background and every used enemy sprite are defined once and referenced by the segments
+        base = SvgCanvas()
+        draw_segment_base(base)
+        defs = [f'<g id="segment-base">\n{base.result()}\n</g>']
+        for enemy_type in EnemyType:
+            enemy_name = enemy_type.name.lower()
+            if f'href="#enemy-{enemy_name}"' in body:
+                with open(os.path.join(PATH_ENEMIES, f"{enemy_name}.png"), "rb") as f:
+                    data = base64.b64encode(f.read()).decode("ascii")
+                defs.append(f'<symbol id="enemy-{enemy_name}" viewBox="0 0 1 1" preserveAspectRatio="none">'
+                            f'<image width="1" height="1" preserveAspectRatio="none" href="data:image/png;base64,{data}"/></symbol>')
+        
+        file_name = f"{self.file_name}.svg"
+        with open(os.path.join(self.file_hierarchy, file_name), "w", encoding="utf-8") as f:
+            f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}" '
+                    f'font-family="Arial, Helvetica, sans-serif" font-weight="bold" font-size="{FONT_SIZE}">\n')
+            f.write("<defs>\n" + "\n".join(defs) + "\n</defs>\n")
+            f.write(f'<rect width="{width}" height="{height}" fill="{get_svg_color(BG_COLOR)}"/>\n')
+            f.write(body)
+            f.write("\n</svg>\n")
+        return file_name
+
+OUTPUT_MODES = {
+    "image": ImageOutput,
+    "stream": StreamOutput,
+    "tiles": TilesOutput,
+    "pyramid": PyramidOutput,
+    "svg": SvgOutput,
+}
+
+# enemy sprites pasted by a render, notes on a segment edge are drawn in both segments
+def count_sprite_pastes(chart: Chart, variants: tuple[bool, ...]) -> int:
+    note_index = NoteIndex(chart)
+    notes = sum(len(note_index.get_short_notes(beat_start, beat_start + 16)) for beat_start in get_segment_beats(chart))
+    return notes * sum(1 for render_enemies in variants if render_enemies)
+
+# size of a saved output in bytes, tiles and pyramids count their json and every image next to it
+def get_output_size(path, encoder: ImageEncoder) -> int:
+    if not path.endswith(".json"):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, file))
+               for root, _, files in os.walk(os.path.dirname(path)) for file in files
+               if file == os.path.basename(path) or file.endswith(f".{encoder.extension}"))
+
+def flatten_chart(chart: Chart, render_enemies: bool, jobs: int = 1, output: str = "image", encoder: ImageEncoder = None) -> str:
+    paths = flatten_chart_variants(chart, (render_enemies,), jobs, output, encoder)
+    return paths[0] if paths else None
+
+# renders every variant (render_enemies flag) of a chart in one pass, returns the saved paths or None on failure
+def flatten_chart_variants(chart: Chart, variants: tuple[bool, ...] = (False, True), jobs: int = 1, output: str = "image", encoder: ImageEncoder = None) -> list[str]:
+    if DEBUG_COMBO:
+        print("WARNING: COMBO_DEBUG option is True")
+    
+    name = chart.name
+    difficulty = chart.difficulty
     
     file_hierarchy = f"{PATH_FLAT}/{name}/{difficulty.name.lower()}"
-    file_name = f"{name}_{difficulty.name.lower()}"
-    if render_enemies:
-        file_name += "_er"
-    file_name = f"{file_name}.png"
+    file_names = [f"{name}_{difficulty.name.lower()}" + ("_er" if render_enemies else "") + get_scale_suffix()
+                  for render_enemies in variants]
     
+    encoder = encoder or ImageEncoder()
     try:
+        start_time = time.perf_counter()
         os.makedirs(file_hierarchy, exist_ok=True)
-        img.save(os.path.join(file_hierarchy, file_name))
-        print(f"Saved as {file_name}")
+        outputs = [OUTPUT_MODES[output](file_hierarchy, file_name, encoder, render_enemies)
+                   for file_name, render_enemies in zip(file_names, variants)]
+        # a serial render of a whole image draws the segments straight into it
+        render_time = time.perf_counter()
+        if jobs <= 1 and issubclass(OUTPUT_MODES[output], ImageOutput):
+            for output_file, img in zip(outputs, render_chart_images(chart, variants)):
+                output_file.set_image(img)
+        else:
+            for img_segments in render_segments(chart, variants, jobs, OUTPUT_MODES[output].canvas_type):
+                for output_file, img_segment in zip(outputs, img_segments):
+                    output_file.add(img_segment)
+        # sprite pastes are counted after the clock stops, counting indexes the notes again
+        render_seconds = time.perf_counter() - render_time
+        if is_tracing():
+            log("segment_render", seconds=round(render_seconds, 6), output=output, variants=len(variants), jobs=jobs,
+                segments=len(get_segment_beats(chart)), sprite_pastes=count_sprite_pastes(chart, variants))
+        
+        # size/time report, encoding time is the time spent in close plus what the output wrote while segments came in
+        paths = []
+        encoding = "svg" if output == "svg" else f"{encoder}"
+        for output_file in outputs:
+            save_time = time.perf_counter()
+            file_name = output_file.close()
+            encode_seconds = output_file.encode_seconds + time.perf_counter() - save_time
+            path = os.path.join(file_hierarchy, file_name)
+            size = get_output_size(path, encoder)
+            log("encode", seconds=round(encode_seconds, 6), file=file_name, encoder=encoding, bytes=size)
+            print(f"Saved as {file_name} ({encoding}, {size / 1e6:.2f} MB, encoded in {encode_seconds:.2f} s)")
+            paths.append(path)
+        print(f"Rendered {name}_{difficulty.name.lower()} in {time.perf_counter() - start_time:.2f} s, "
+              f"{sum(get_output_size(path, encoder) for path in paths) / 1e6:.2f} MB total")
     except Exception as e:
-        print(f"Failed saving on {file_name}: {e}")
+        print(f"Failed image creating on {name}_{difficulty.name.lower()}: {e}")
         traceback.print_exc()
+        return None
+    return paths
+
+# everything a render depends on besides the chart itself
+def get_render_inputs(file, output: str = "image", encoder: ImageEncoder = None) -> dict[str, str]:
+    constants = {name: value for name, value in globals().items()
+                 if name.isupper() and isinstance(value, (bool, int, float, tuple))}
+    return {
+        "json": hash_file(file),
+        "enemies": hash_dir(PATH_ENEMIES),
+        "constants": hash_value(constants),
+        "output": output,
+        "encoder": f"{encoder or ImageEncoder()}",
+    }
+
+# renders both plain and enemy images of a chart, returns the saved paths or None on failure
+def flatten_file(file, jobs: int = 1, output: str = "image", encoder: ImageEncoder = None) -> list[str]:
+    with chart_scope(get_chart_id(file), "flatten"):
+        try:
+            chart = load_chart_file(file)
+        except Exception as e:
+            print(f"Failed JSON open on {file}: {e}")
+            traceback.print_exc()
+            return None
+        
+        return flatten_chart_variants(chart, (False, True), jobs=jobs, output=output, encoder=encoder)
+
+# renders only charts whose JSON, sprites or render constants changed since the last recorded render
+def flatten_files(json_files: list[str], jobs: int, force: bool = False, chart_jobs: bool = True, output: str = "image", encoder: ImageEncoder = None):
+    manifest = Manifest()
+    inputs = {file: get_render_inputs(file, output, encoder) for file in json_files}
+    # renders at other scales are separate outputs, recorded next to the default ones
+    keys = {file: file + get_scale_suffix() for file in json_files}
+
+    stale_files = []
+    for file in json_files:
+        if not force and manifest.is_fresh("flatten", keys[file], inputs[file]):
+            print(f"Skipping up-to-date render: {file}")
+        else:
+            stale_files.append(file)
+
+    # either charts or segments are spread over the pool, never both
+    if chart_jobs:
+        results, _ = run_jobs(partial(flatten_file, output=output, encoder=encoder), stale_files, jobs,
+                              initializer=set_render_scale, initargs=(RENDER_SCALE,))
+    else:
+        results, _ = run_jobs(partial(flatten_file, jobs=jobs, output=output, encoder=encoder), stale_files, 1)
+    for file, outputs in results.items():
+        manifest.record("flatten", keys[file], inputs[file], outputs)
+    manifest.save()
 
 if __name__ == "__main__":
     import argparse
@@ -299,41 +849,36 @@ if __name__ == "__main__":
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("-a", "--all", action="store_true")
     group.add_argument("-i", "--input")
-    parser.add_argument("-f", "--force", action="store_true", help="force render even if file exists")
+    parser.add_argument("-f", "--force", action="store_true", help="force render even if chart is unchanged")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes, one chart each, for --all (default: core count)")
+    parser.add_argument("--segment-jobs", type=int, default=1, help="number of worker processes rendering segments of the chart for --input (default: 1). segments are sent back to be stitched, which costs more memory than it saves time")
+    parser.add_argument("-o", "--output", choices=list(OUTPUT_MODES), default="image", help="image: one stitched PNG, stream: PNG encoded segment by segment with bounded memory, tiles: one image per segment, pyramid: deep-zoom tiles for the chart viewer, svg: vector chart")
+    parser.add_argument("-e", "--encoder", choices=IMAGE_ENCODERS, default="png", help="png: truecolor PNG, palette: 16-color PNG for the plain chart, webp: lossless WebP (tiles and pyramid only)")
+    parser.add_argument("-l", "--level", type=int, help="compression level, 0-9 for png and palette (default 6), 0-6 for webp (default 4)")
+    parser.add_argument("-s", "--scale", type=int, default=DEFAULT_RENDER_SCALE, help=f"render scale, 1 is one pixel per layout unit (default: {DEFAULT_RENDER_SCALE}). other scales are saved with an @{{scale}}x suffix")
+    add_arguments(parser)
     args = parser.parse_args()
-    
-    json_files = []
+    apply_arguments(args)
+
+    if args.scale < 1:
+        parser.error("Scale should be a positive integer.")
+    set_render_scale(args.scale)
 
+    if args.output == "svg" and (args.encoder != "png" or args.level is not None):
+        parser.error("SVG output does not use an image encoder.")
+    if args.encoder == "webp" and args.output in ("image", "stream"):
+        parser.error(f"WebP images are at most {WEBP_MAX_SIZE} pixels wide, use --output tiles or pyramid.")
+    if args.output == "stream" and args.encoder != "png":
+        parser.error("Stream output only supports the png encoder.")
+    if args.level is not None and not 0 <= args.level <= (6 if args.encoder == "webp" else 9):
+        parser.error(f"Level {args.level} is out of range for the {args.encoder} encoder.")
+    encoder = ImageEncoder(args.encoder, args.level)
+    
     if args.all:
         json_files = glob.glob(os.path.join(PATH_JSON, "*.json"))
+        flatten_files(json_files, args.jobs, args.force, output=args.output, encoder=encoder)
     else:
         if not args.input:
             parser.error("Should specify input. Type --help for more information.")
         else:
-            json_files = [args.input]
-    
-    for file in json_files:
-        try:
-            with open(file, 'r') as f:
-                data = json.load(f)
-        except Exception as e:
-            print(f"Failed JSON open on {file}: {e}")
-            traceback.print_exc()
-        
-        chart = load_chart(data)
-        name = chart.name
-        difficulty = chart.difficulty
-        file_hierarchy = f"{PATH_FLAT}/{name}/{difficulty.name.lower()}"
-        file_name = f"{name}_{difficulty.name.lower()}"
-
-        file_path = os.path.join(file_hierarchy, f"{file_name}.png")
-        file_path_er = os.path.join(file_hierarchy, f"{file_name}_er.png")
-
-        if not args.force and os.path.exists(file_path):
-            print(f"Skipping existing render: {file_name}")
-        else:
-            flatten(file, render_enemies=False)
-        if not args.force and os.path.exists(file_path_er):
-            print(f"Skipping existing render: {file_name}_er")
-        else:
-            flatten(file, render_enemies=True)
+            flatten_files([args.input], args.segment_jobs, args.force, chart_jobs=False, output=args.output, encoder=encoder)
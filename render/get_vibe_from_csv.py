@@ -1,77 +1,155 @@
-import os, glob, csv, json, bisect
+import os, glob, csv, time
+from functools import lru_cache
 from rift_essentials import *
+from manifest import *
+from instrument import log_since, chart_scope, get_chart_id, add_arguments, apply_arguments
 
-def get_vibe(file):
-    NAME_TO_ROW_HEAD = {
-        'Brave the Harvester': "Brave The Harvester",
-        'Glass Cages (feat. Sarah Hubbard)': "Glass Cages",
-        'Om and On': "Om And On",
-        'Under the Thunder': "Under The Thunder",
-        'RAVEVENGE (feat. Aram Zero)': "RAVEVENGE",
-        "What's in the Box": "What's In The Box?"
-    }
-    
-    with open(file, 'r') as f:
-        data = json.load(f)
-        
-    chart = load_chart(data)
-    name = chart.name
+# parse.py takes optimal vibes and max score from the hand-maintained spreadsheet through this module,
+# and only solves them with vibe_solver.py for charts without a row.
+# Run on its own, this merges the spreadsheet into existing JSONs after the CSV is edited.
+VIBE_PATH_CSV = 'vibe_path.csv'
 
-    row_head = NAME_TO_ROW_HEAD[name] if name in NAME_TO_ROW_HEAD else name
-    try:
-        with open('vibe_path.csv', 'r', newline='') as csvfile:
-            reader = csv.reader(csvfile)
+# chart names that differ from their spreadsheet row by more than case and punctuation
+NAME_TO_ROW_HEAD = {
+    'Glass Cages (feat. Sarah Hubbard)': "Glass Cages",
+    'RAVEVENGE (feat. Aram Zero)': "RAVEVENGE",
+}
 
-            target_rows = []
+# "What's in the Box" and "What's In The Box?" are the same song
+def normalize_song_name(name: str) -> str:
+    return "".join(char for char in name.casefold() if char.isalnum())
+
+# vibe_path.csv rows by (normalized song name, difficulty), read once and shared by every chart
+class VibeIndex():
+    def __init__(self, path=VIBE_PATH_CSV):
+        self.rows: dict[tuple[str, DifficultyType], list[str]] = {}
+        # without the spreadsheet every chart is solved
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', newline='') as csvfile:
+            reader = csv.reader(csvfile)
             for row in reader:
-                if row[0] == row_head:
-                    target_rows.append(row)
-            target_row = target_rows[DifficultyType(chart.difficulty).value]
+                # header rows and blank lines have no difficulty
+                if len(row) < 3 or row[1].upper() not in DifficultyType.__members__:
+                    continue
+                self.rows[(normalize_song_name(row[0]), DifficultyType[row[1].upper()])] = row
         
-        chart.max_score = int(target_row[2])
-        chart.optimal_vibes = []
-        for i in range(3, len(target_row), 4):
-            if target_row[i] == '':
-                continue
-
-            beat = float(target_row[i+1][1:]) - 1
-            # spreadsheet was starting beat at 1
-            enemies = int(target_row[i+3])
+        for name, row_head in NAME_TO_ROW_HEAD.items():
+            for difficulty in DifficultyType:
+                row = self.rows.get((normalize_song_name(row_head), difficulty))
+                if row is not None:
+                    self.rows[(normalize_song_name(name), difficulty)] = row
+
+    # None when the spreadsheet has no row for the chart
+    def find(self, name: str, difficulty: DifficultyType) -> list[str]:
+        return self.rows.get((normalize_song_name(name), DifficultyType(difficulty)))
+
+@lru_cache(maxsize=None)
+def get_vibe_index() -> VibeIndex:
+    return VibeIndex()
+
+def find_vibe_row(name: str, difficulty: DifficultyType) -> list[str]:
+    return get_vibe_index().find(name, difficulty)
+
+# one line for all charts without a spreadsheet row, instead of an error per chart
+def print_missing_vibe_rows(charts: list[tuple[str, DifficultyType]]):
+    if not charts:
+        return
+    names = sorted(f"{name} ({DifficultyType(difficulty).name.capitalize()})" for name, difficulty in charts)
+    print(f"No vibe data in {VIBE_PATH_CSV} for {len(names)} chart(s): {', '.join(names)}")
+
+def apply_vibe(chart: Chart, target_row: list[str]) -> None:
+    chart.max_score = int(target_row[2])
+    chart.optimal_vibes = []
+    for i in range(3, len(target_row), 4):
+        if target_row[i] == '':
+            continue
+
+        beat = float(target_row[i+1][1:]) - 1
+        # spreadsheet was starting beat at 1
+        enemies = int(target_row[i+3])
             
-            chart.optimal_vibes.append(VibeData(beat, enemies))
+        chart.optimal_vibes.append(VibeData(beat, enemies))
+
+# merges vibe data into the chart JSON, skipped when its CSV row and the JSON are unchanged since the last merge.
+# charts without a CSV row are added to missing, for one summary at the end.
+def get_vibe(file, manifest: Manifest = None, force: bool = False, missing: list = None) -> bool:
+    with chart_scope(get_chart_id(file), "vibe"):
+        chart = load_chart_file(file)
+        name = chart.name
+
+        try:
+            start_time = time.perf_counter()
+            target_row = find_vibe_row(name, chart.difficulty)
+            log_since("vibe_lookup", start_time, found=target_row is not None)
+            if target_row is None:
+                if missing is not None:
+                    missing.append((name, chart.difficulty))
+                return False
+
+            inputs = {"vibe_row": hash_value(target_row)}
+            if manifest is not None and not force and manifest.is_fresh("vibe", file, inputs):
+                print(f"Skipping up-to-date vibe data in {file}")
+                return True
+        
+            start_time = time.perf_counter()
+            previous = (chart.max_score, hash_value(chart.optimal_vibes))
+            apply_vibe(chart, target_row)
+            log_since("vibe_apply", start_time, vibes=len(chart.optimal_vibes))
 
-        # deprecated
-        """
-        # determine vibe for all notes
-        all_notes: list[Note] = chart.short_notes + chart.wyrm_notes
-        all_notes.sort(key=lambda note: note.beat_start)
+            # deprecated
+            """
+            # determine vibe for all notes
+            all_notes: list[Note] = chart.short_notes + chart.wyrm_notes
+            all_notes.sort(key=lambda note: note.beat_start)
         
-        # function implementation of binary search
-        def binary_search(target_beat: float):
-            beat_start_list = [note.beat_start for note in all_notes]
-            index = bisect.bisect_left(beat_start_list, target_beat)
-            if index < len(all_notes):
-                return index
-            return None
-
-        for vibe_data in chart.optimal_vibes:
-            index_from = binary_search(vibe_data.beat - 0.1)
-            index_to = min(index_from + vibe_data.enemies, len(all_notes)) - 1
+            # function implementation of binary search
+            def binary_search(target_beat: float):
+                beat_start_list = [note.beat_start for note in all_notes]
+                index = bisect.bisect_left(beat_start_list, target_beat)
+                if index < len(all_notes):
+                    return index
+                return None
+
+            for vibe_data in chart.optimal_vibes:
+                index_from = binary_search(vibe_data.beat - 0.1)
+                index_to = min(index_from + vibe_data.enemies, len(all_notes)) - 1
             
-            while index_to + 1 < len(all_notes) and all_notes[index_to].beat_start == all_notes[index_to + 1].beat_start:
-                index_to += 1
+                while index_to + 1 < len(all_notes) and all_notes[index_to].beat_start == all_notes[index_to + 1].beat_start:
+                    index_to += 1
             
-            for i in range(index_from, index_to + 1):
-                all_notes[i].is_vibe = True
-        """
-
-        with open(file, "w", encoding="utf-8") as f:
-            json.dump(chart, f, indent=4, cls=CustomJsonEncoder)
-        print(f"Vibe data added in {file}")
-    except Exception as e:
-        print(f"Cannot get vibe data for {name}: {e}")
+                for i in range(index_from, index_to + 1):
+                    all_notes[i].is_vibe = True
+            """
+
+            # the JSON is only rewritten when the vibe data actually changed
+            if (chart.max_score, hash_value(chart.optimal_vibes)) == previous:
+                print(f"Vibe data unchanged in {file}")
+            else:
+                start_time = time.perf_counter()
+                save_chart(chart, file)
+                log_since("save_json", start_time, bytes=os.path.getsize(file))
+                print(f"Vibe data added in {file}")
+            if manifest is not None:
+                manifest.record("vibe", file, inputs, [file])
+            return True
+        except Exception as e:
+            print(f"Cannot get vibe data for {name}: {e}")
+            return False
     
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--force", action="store_true", help="force merge even if vibe data is unchanged")
+    add_arguments(parser)
+    args = parser.parse_args()
+    apply_arguments(args)
+
+    manifest = Manifest()
     json_files = glob.glob(os.path.join(PATH_JSON, "*.json"))
+    missing = []
     for file in json_files:
-        get_vibe(file)
\ No newline at end of file
+        get_vibe(file, manifest, args.force, missing)
+    manifest.save()
+    print_missing_vibe_rows(missing)
\ No newline at end of file
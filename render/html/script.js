@@ -1,39 +1,174 @@
 let isEnemyRenderOn = false;
 
+const chartViewers = {};
+
+function getCharts() {
+    return [
+        document.getElementById("chart-img-normal"),
+        document.getElementById("chart-img-enemy-render"),
+    ];
+}
+
+function showChart(chart, isShown) {
+    if (!isShown) {
+        chart.style.display = "none";
+    } else {
+        chart.style.display = chart.tagName === "IMG" ? "inline" : "inline-block";
+        if (chartViewers[chart.id]) {
+            chartViewers[chart.id].layout();
+        }
+    }
+}
+
+// Deep-zoom viewer: loads only the tiles of the best-fitting pyramid level
+// that are inside (or close to) the visible part of the chart.
+function createPyramidViewer(chart) {
+    const content = chart.parentElement;
+    // the chart keeps its initial height, like a plain image, so browser zoom enlarges it
+    const viewer = { pyramid: null, level: -1, tiles: {}, displayHeight: window.innerHeight };
+
+    viewer.layout = function () {
+        if (!viewer.pyramid || chart.style.display === "none") {
+            return;
+        }
+        const pyramid = viewer.pyramid;
+        const fullLevel = pyramid.levels[0];
+        const displayHeight = viewer.displayHeight;
+        const scale = displayHeight / fullLevel.height;
+
+        chart.style.height = displayHeight + "px";
+        chart.style.width = Math.round(fullLevel.width * scale) + "px";
+
+        // smallest level that still has enough pixels for the screen
+        const pinchZoom = window.visualViewport ? window.visualViewport.scale : 1;
+        const neededHeight = displayHeight * (window.devicePixelRatio || 1) * pinchZoom;
+        let level = 0;
+        while (
+            level + 1 < pyramid.levels.length &&
+            pyramid.levels[level + 1].height >= neededHeight
+        ) {
+            level++;
+        }
+        if (level !== viewer.level) {
+            chart.replaceChildren();
+            viewer.tiles = {};
+            viewer.level = level;
+        }
+        viewer.update();
+    };
+
+    viewer.update = function () {
+        if (!viewer.pyramid || viewer.level < 0 || chart.style.display === "none") {
+            return;
+        }
+        const pyramid = viewer.pyramid;
+        const level = pyramid.levels[viewer.level];
+        const tileScale = chart.clientHeight / level.height;
+        const tileSize = pyramid.tile_size * tileScale;
+
+        const margin = content.clientWidth / 2;
+        const left = content.scrollLeft - chart.offsetLeft - margin;
+        const right = content.scrollLeft - chart.offsetLeft + content.clientWidth + margin;
+        const columnFrom = Math.max(0, Math.floor(left / tileSize));
+        const columnTo = Math.min(level.columns - 1, Math.floor(right / tileSize));
+
+        for (let column = columnFrom; column <= columnTo; column++) {
+            for (let row = 0; row < level.rows; row++) {
+                const key = column + "_" + row;
+                if (viewer.tiles[key]) {
+                    continue;
+                }
+                const tile = document.createElement("img");
+                tile.className = "chart-tile";
+                tile.src = `${viewer.base}/${viewer.level}/${key}.${pyramid.format}`;
+                tile.style.left = column * tileSize + "px";
+                tile.style.top = row * tileSize + "px";
+                tile.style.width =
+                    Math.min(pyramid.tile_size, level.width - column * pyramid.tile_size) * tileScale + "px";
+                tile.style.height =
+                    Math.min(pyramid.tile_size, level.height - row * pyramid.tile_size) * tileScale + "px";
+                chart.appendChild(tile);
+                viewer.tiles[key] = tile;
+            }
+        }
+    };
+
+    const url = chart.dataset.pyramid;
+    viewer.base = url.substring(0, url.lastIndexOf("/"));
+    fetch(url)
+        .then((response) => response.json())
+        .then((pyramid) => {
+            viewer.pyramid = pyramid;
+            viewer.layout();
+        });
+
+    let isUpdateQueued = false;
+    content.addEventListener("scroll", function () {
+        if (!isUpdateQueued) {
+            isUpdateQueued = true;
+            window.requestAnimationFrame(function () {
+                isUpdateQueued = false;
+                viewer.update();
+            });
+        }
+    });
+
+    return viewer;
+}
+
 function updateImageHeight() {
-    const img1 = document.getElementById("chart-img-normal");
-    const img2 = document.getElementById("chart-img-enemy-render");
+    const [chart1, chart2] = getCharts();
     const initialHeight = window.innerHeight;
 
-    img1.style.height = initialHeight + "px";
-    img2.style.height = initialHeight + "px";
+    for (const chart of [chart1, chart2]) {
+        if (chart.tagName === "IMG") {
+            chart.style.height = initialHeight + "px";
+        }
+    }
 
-    img1.style.display = "inline";
-    img2.style.display = "none";
+    showChart(chart2, false);
+    showChart(chart1, true);
+}
+
+function addPyramidViewers() {
+    for (const chart of getCharts()) {
+        if (chart.dataset.pyramid) {
+            chartViewers[chart.id] = createPyramidViewer(chart);
+        }
+    }
+    // zooming changes devicePixelRatio (or the pinch scale), so the level is picked again
+    const layoutAll = function () {
+        for (const viewer of Object.values(chartViewers)) {
+            viewer.layout();
+        }
+    };
+    window.addEventListener("resize", layoutAll);
+    if (window.visualViewport) {
+        window.visualViewport.addEventListener("resize", layoutAll);
+    }
 }
 
 function addToggleFeature() {
     const toggleButton = document.getElementById("toggle-button");
+    const [chartNormal, chartEnemyRender] = getCharts();
     toggleButton.addEventListener("click", function () {
         isEnemyRenderOn = !isEnemyRenderOn; // Toggle state
         if (isEnemyRenderOn) {
             toggleButton.textContent = "Enemy Render ON";
             toggleButton.classList.add("on");
-            document.getElementById("chart-img-normal").style.display = "none";
-            document.getElementById("chart-img-enemy-render").style.display =
-                "inline";
+            showChart(chartNormal, false);
+            showChart(chartEnemyRender, true);
         } else {
             toggleButton.textContent = "Enemy Render OFF";
             toggleButton.classList.remove("on");
-            document.getElementById("chart-img-normal").style.display =
-                "inline";
-            document.getElementById("chart-img-enemy-render").style.display =
-                "none";
+            showChart(chartEnemyRender, false);
+            showChart(chartNormal, true);
         }
     });
 }
 
 document.addEventListener("DOMContentLoaded", function () {
+    addPyramidViewers();
     updateImageHeight();
     addToggleFeature();
 });
@@ -0,0 +1,81 @@
+import os, re, json, time, cProfile
+from contextlib import contextmanager
+
+# Opt-in instrumentation: per-chart stage timings, counts and bytes written, as JSON lines,
+# and an optional cProfile dump per chart. Both are switched on through environment variables,
+# so process pool workers inherit them:
+#   RIFT_TRACE=path     append one JSON object per measured stage to path
+#   RIFT_PROFILE=dir    dump a cProfile of every chart as dir/{script}_{chart}.prof
+# Every script takes --trace and --profile, which set them.
+TRACE_ENV = "RIFT_TRACE"
+PROFILE_ENV = "RIFT_PROFILE"
+
+# chart named in every record, set by chart_scope
+current_chart: str = None
+
+def is_tracing() -> bool:
+    return bool(os.environ.get(TRACE_ENV))
+
+def log(stage: str, **fields):
+    path = os.environ.get(TRACE_ENV)
+    if not path:
+        return
+    record = {"time": round(time.time(), 3), "pid": os.getpid(), "chart": current_chart, "stage": stage, **fields}
+    # one short append per record, so lines from worker processes do not interleave
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+# times the block as one stage. counts found inside the block can be added to the yielded dict.
+@contextmanager
+def measure(stage: str, **fields):
+    start_time = time.perf_counter()
+    yield fields
+    if is_tracing():
+        log(stage, seconds=round(time.perf_counter() - start_time, 6), **fields)
+
+# logs a stage that started at start_time (from time.perf_counter), for code that runs straight through
+def log_since(stage: str, start_time: float, **fields):
+    if is_tracing():
+        log(stage, seconds=round(time.perf_counter() - start_time, 6), **fields)
+
+# chart id of a chart JSON, which is named after it. captures are traced under the same id (see parse.read_chart_id)
+def get_chart_id(file) -> str:
+    return os.path.splitext(os.path.basename(file))[0]
+
+# attributes every record inside the block to a chart, logs its total time as the script's stage
+# and profiles it when enabled. nested scopes keep the outer chart and profile.
+@contextmanager
+def chart_scope(chart_id: str, script: str):
+    global current_chart
+    if current_chart is not None:
+        yield
+        return
+
+    profile_dir = os.environ.get(PROFILE_ENV)
+    profiler = cProfile.Profile() if profile_dir else None
+    current_chart = chart_id
+    try:
+        with measure(script):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+    finally:
+        current_chart = None
+        if profiler is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            file_name = re.sub(r"[^\w.-]", "_", f"{script}_{chart_id}")
+            profiler.dump_stats(os.path.join(profile_dir, f"{file_name}.prof"))
+
+def add_arguments(parser):
+    parser.add_argument("--trace", help="append per-chart stage timings and counts as JSON lines to this file")
+    parser.add_argument("--profile", help="dump a cProfile of every chart into this directory")
+
+def apply_arguments(args):
+    if args.trace:
+        os.environ[TRACE_ENV] = os.path.abspath(args.trace)
+    if args.profile:
+        os.environ[PROFILE_ENV] = os.path.abspath(args.profile)
@@ -0,0 +1,59 @@
+import os, json, hashlib
+from rift_essentials import *
+
+# Build manifest
+# Every stage records, per key (usually its input file), the content hashes of
+# everything the result depends on and the hashes of the outputs it wrote.
+# A key is fresh when the inputs hash the same and every output is still on disk untouched.
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def hash_file(path) -> str:
+    try:
+        with open(path, "rb") as f:
+            return hash_bytes(f.read())
+    except FileNotFoundError:
+        return ""
+
+def hash_value(value) -> str:
+    return hash_bytes(json.dumps(value, sort_keys=True, cls=CustomJsonEncoder).encode("utf-8"))
+
+def hash_dir(path) -> str:
+    files = sorted(os.listdir(path)) if os.path.isdir(path) else []
+    return hash_value({file: hash_file(os.path.join(path, file)) for file in files})
+
+def manifest_key(path) -> str:
+    return os.path.normpath(path).replace(os.sep, "/")
+
+class Manifest():
+    def __init__(self, path: str = PATH_MANIFEST):
+        self.path = path
+        self.stages: dict[str, dict] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.stages = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Failed manifest load on {path}, rebuilding everything: {e}")
+
+    def get_outputs(self, stage: str, key: str) -> list[str]:
+        entry = self.stages.get(stage, {}).get(manifest_key(key))
+        return list(entry["outputs"]) if entry else []
+
+    def is_fresh(self, stage: str, key: str, inputs: dict[str, str]) -> bool:
+        entry = self.stages.get(stage, {}).get(manifest_key(key))
+        if entry is None or entry["inputs"] != inputs:
+            return False
+        return all(hash_file(output) == output_hash for output, output_hash in entry["outputs"].items())
+
+    def record(self, stage: str, key: str, inputs: dict[str, str], outputs: list[str]):
+        self.stages.setdefault(stage, {})[manifest_key(key)] = {
+            "inputs": inputs,
+            "outputs": {manifest_key(output): hash_file(output) for output in outputs},
+        }
+
+    def save(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.stages, f, indent=4, sort_keys=True)
@@ -1,5 +1,13 @@
-import json, struct, glob, os, traceback
+import struct, glob, os, time, heapq, bisect, traceback
+from functools import partial
+from collections import defaultdict, deque, Counter
+from itertools import groupby, accumulate, chain
+from collections.abc import Iterable, Iterator
 from rift_essentials import *
+from manifest import *
+from vibe_solver import solve_vibes, get_solver_constants
+from get_vibe_from_csv import find_vibe_row, apply_vibe
+from instrument import log, log_since, chart_scope, get_chart_id, add_arguments, apply_arguments
 
 def read_int(f) -> int:
     return struct.unpack('<i', f.read(4))[0]
@@ -14,144 +22,447 @@ def read_string(f) -> str:
     length = struct.unpack('<b', f.read(1))[0]
     return f.read(length).decode('utf-8')
 
-def parse(file) -> None:
-    # read bin file
-    with open(file, "rb") as f:
-        header = read_string(f)
+# event record layout (65 bytes, no padding)
+# event_type, time, beat, target_time, target_beat, enemy_type, column,
+# total_score, base_score, base_score_multiplier, vibe_score_multiplier, bonus_score, is_vibe
+EVENT_RECORD = struct.Struct('<i4d7i?')
+
+EVENT_CHUNK = 4096  # records read and decoded at once
+
+# streams the event block chunk by chunk, decoding every record with a precompiled struct,
+# so memory does not grow with the number of events in the capture
+def iter_events(f, event_count: int) -> Iterator[tuple]:
+    remaining = event_count
+    while remaining > 0:
+        chunk_count = min(EVENT_CHUNK, remaining)
+        data = f.read(EVENT_RECORD.size * chunk_count)
+        if len(data) != EVENT_RECORD.size * chunk_count:
+            raise EOFError(f"expected {event_count} events, got {event_count - remaining + len(data) // EVENT_RECORD.size}")
+        yield from EVENT_RECORD.iter_unpack(data)
+        remaining -= chunk_count
+
+HIT = EventType.HIT.value
+HOLD_COMPLETE = EventType.HOLD_COMPLETE.value
+VIBE_GAINED = EventType.VIBE_GAINED.value
+WYRM = EnemyType.WYRM.value
+
+# keeps the events notes and vibes are made of: hits, wyrm finishes and vibe gains,
+# as (event_type, target_beat, target_time, column, enemy_type), beats rounded to 3 decimal points.
+# misses, overpresses and hold segments are dropped as they stream by.
+def iter_note_events(records: Iterable[tuple]) -> Iterator[tuple]:
+    for record in records:
+        event_type, enemy_type = record[0], record[5]
+        if event_type == HIT or event_type == VIBE_GAINED or (event_type == HOLD_COMPLETE and enemy_type == WYRM):
+            yield event_type, round(record[4], 3), record[3], record[6], enemy_type
+
+# pairs wyrm starts (sorted by beat) with finishes (sorted by beat) through a pending queue per column,
+# sets beat_finish of every matched wyrm and returns what could not be paired as diagnostics
+def pair_wyrms(wyrm_notes: list[Note], finishes: list[tuple[float, int]]) -> list[dict]:
+    diagnostics: list[dict] = []
+    pending: dict[int, deque[Note]] = defaultdict(deque)
+    for note in wyrm_notes:
+        pending[note.column].append(note)
+
+    for beat, column in finishes:
+        if not pending[column]:
+            diagnostics.append({"type": "unmatched_finish", "beat": beat, "column": column})
+            continue
+        note = pending[column].popleft()
+        note.beat_finish = beat
+        if beat < note.beat_start:
+            diagnostics.append({"type": "finish_before_start", "beat": note.beat_start, "column": column})
+
+    for column in sorted(pending):
+        for note in pending[column]:
+            diagnostics.append({"type": "unmatched_start", "beat": note.beat_start, "column": column})
+
+    # wyrms in the same column must not overlap
+    last_finish: dict[int, float] = {}
+    for note in wyrm_notes:
+        if note.column in last_finish and note.beat_start < last_finish[note.column]:
+            diagnostics.append({"type": "overlap", "beat": note.beat_start, "column": note.column})
+        if note.beat_finish != 0.0:
+            last_finish[note.column] = max(last_finish.get(note.column, note.beat_finish), note.beat_finish)
+    
+    return diagnostics
+
+# every note's combo is the number of notes up to and including its beat.
+# both lists are sorted by beat, so their beats are merged once and grouped; a group's combo is the running total of group sizes.
+# returns the beat and size of every group, for get_chart_stats.
+def assign_combo(short_notes: list[Note], wyrm_notes: list[Note]) -> tuple[list[float], list[int]]:
+    beats = heapq.merge([note.beat_start for note in short_notes], [note.beat_start for note in wyrm_notes])
+    group_beats: list[float] = []
+    group_sizes: list[int] = []
+    for beat, group in groupby(beats):
+        group_beats.append(beat)
+        group_sizes.append(sum(1 for _ in group))
+
+    combo_by_beat = dict(zip(group_beats, accumulate(group_sizes)))
+    for note in chain(short_notes, wyrm_notes):
+        note.combo = combo_by_beat[note.beat_start]
+    return group_beats, group_sizes
+
+DENSITY_WINDOW = 16     # in beats
+
+# note statistics stored in the chart JSON:
+#   notes_per_beat      average over the span from the first to the last note
+#   peak_density        most notes within DENSITY_WINDOW beats, starting at peak_density_beat
+#   chords              number of beats with 2, 3, ... notes
+#   enemies             number of notes of every enemy type
+def get_chart_stats(notes: list[Note], group_beats: list[float], group_sizes: list[int]) -> dict:
+    if not group_beats:
+        return {"notes_per_beat": 0.0, "peak_density": 0, "peak_density_beat": 0.0, "chords": {}, "enemies": {}}
+    
+    # notes in [beat, beat + DENSITY_WINDOW) for every group beat, from the running totals
+    combos = [0, *accumulate(group_sizes)]
+    peak_density, peak_density_beat = 0, group_beats[0]
+    for index, beat in enumerate(group_beats):
+        window_end = bisect.bisect_left(group_beats, beat + DENSITY_WINDOW, index)
+        density = combos[window_end] - combos[index]
+        if density > peak_density:
+            peak_density, peak_density_beat = density, beat
 
-        if header != "RIFT_EVENT_CAPTURE":
-            print(f"Warning: unexpected header {header}. Skipping current file.")
+    span = group_beats[-1] - group_beats[0]
+    chords = Counter(size for size in group_sizes if size > 1)
+    enemies = Counter(note.enemy_type.name for note in notes)
+    return {
+        "notes_per_beat": round(len(notes) / span, 3) if span > 0 else float(len(notes)),
+        "peak_density": peak_density,
+        "peak_density_beat": peak_density_beat,
+        "chords": {str(size): chords[size] for size in sorted(chords)},
+        "enemies": {name: enemies[name] for name in sorted(enemies)},
+    }
+
+# header and note events of a capture, or of several captures merged by merge_captures
+class Capture():
+    __slots__ = ("file", "name", "level_id", "difficulty", "base_bpm", "divisions", "event_count",
+                 "hits", "wyrm_finishes", "timing", "vibe_gains")
+
+    def __init__(self, file):
+        self.file = file
+        self.name: str = ""
+        self.level_id: str = ""
+        self.difficulty: DifficultyType = DifficultyType.EASY
+        self.base_bpm: int = 0
+        self.divisions: int = 0
+        self.event_count: int = 0
+        self.hits: list[tuple[float, int, int]] = []        # (target_beat, column, enemy_type)
+        self.wyrm_finishes: list[tuple[float, int]] = []    # (target_beat, column)
+        self.timing: dict[float, float] = {}                # target_time of every hit beat, for the vibe solver
+        self.vibe_gains: list[float] = []
+
+    # id of the chart made from the capture, which is also the stem of its JSON
+    def get_chart_id(self) -> str:
+        return f"{self.name}_{self.difficulty.value}"
+
+# reads everything before the events, returns None when f is not a capture
+def read_capture_header(f, file) -> Capture:
+    header = read_string(f)
+
+    if header != "RIFT_EVENT_CAPTURE":
+        print(f"Warning: unexpected header {header} in {file}. Skipping current file.")
+        return None
+    capture = Capture(file)
+    
+    # version
+    version = read_int(f)
+
+    # name, level_id
+    capture.name = read_string(f)
+    capture.level_id = read_string(f)
+
+    # difficulty
+    capture.difficulty = DifficultyType(read_int(f))
+
+    # pins(modifiers)
+    pin_count = read_int(f)
+    for _ in range(pin_count):
+        pin = read_string(f)
+
+    # bpm, divisions, beat count, beat timings
+    capture.base_bpm = read_int(f)
+    capture.divisions = read_int(f)
+    beat_count = read_int(f)
+    f.read(8 * beat_count) # beat timings are unused
+    return capture
+
+# the capture's header, None when it cannot be read or is not a capture
+def read_capture_file_header(file) -> Capture:
+    try:
+        with open(file, "rb") as f:
+            return read_capture_header(f, file)
+    except OSError:
+        return None
+
+def read_capture(file) -> Capture:
+    start_time = time.perf_counter()
+    with open(file, "rb") as f:
+        capture = read_capture_header(f, file)
+        if capture is None:
             return None
         
-        # version
-        version = read_int(f)
-
-        # name, level_id
-        name = read_string(f)
-        level_id = read_string(f)
-
-        # difficulty
-        difficulty = DifficultyType(read_int(f))
-
-        # pins(modifiers)
-        pin_count = read_int(f)
-        for _ in range(pin_count):
-            pin = read_string(f)
-
-        # bpm, divisions, beat count, beat timings
-        base_bpm = read_int(f)
-        divisions = read_int(f)
-        beat_count = read_int(f)
-        for _ in range(beat_count):
-            beat_timing = read_double(f)
-        
-        # events
-        events: list[Event] = []
-        event_count = read_int(f)
-        for _ in range(event_count):
-            event = Event()
-            event.event_type = EventType(read_int(f))
-            event.time = read_double(f)
-            event.beat = read_double(f)
-            event.target_time = read_double(f)
-            event.target_beat = round(read_double(f), 3) # rounds up to 3 decimal points
-            event.enemy_type = EnemyType(read_int(f))
-            event.column = read_int(f)
-            event.total_score = read_int(f)
-            event.base_score = read_int(f)
-            event.base_score_multiplier = read_int(f)
-            event.vibe_score_multiplier = read_int(f)
-            event.bonus_score = read_int(f)
-            event.is_vibe = read_bool(f)
-
-            events.append(event)
+        # events, streamed straight into note events
+        # only (target_beat, enemy_type, column) is needed, so records are filtered without building Event objects
+        capture.event_count = read_int(f)
+        for event_type, beat, target_time, column, enemy_type in iter_note_events(iter_events(f, capture.event_count)):
+            if event_type == HIT:
+                capture.hits.append((beat, column, enemy_type))
+                capture.timing[beat] = target_time
+            elif event_type == VIBE_GAINED:
+                capture.vibe_gains.append(beat)
+            else:
+                capture.wyrm_finishes.append((beat, column))
+    log_since("decode", start_time, events=capture.event_count, bytes=os.path.getsize(file))
+    return capture
+
+# the highest count of every key over the captures. a capture with fewer is missing some, returned as diagnostics.
+def merge_counts(counts: list[Counter], captures: list[Capture], kind: str) -> tuple[Counter, list[dict]]:
+    merged = Counter()
+    for capture_counts in counts:
+        merged |= capture_counts
     
-    # create notes
-    short_note_events = list(filter(lambda event: event.event_type == EventType.HIT and event.enemy_type != EnemyType.WYRM, events))
-    wyrm_start_events = list(filter(lambda event: event.event_type == EventType.HIT and event.enemy_type == EnemyType.WYRM, events))
-    wyrm_finish_events = list(filter(lambda event: event.event_type == EventType.HOLD_COMPLETE and event.enemy_type == EnemyType.WYRM, events))
+    diagnostics = []
+    for capture, capture_counts in zip(captures, counts):
+        for key in sorted(merged - capture_counts):
+            diagnostics.append({"type": f"missing_{kind}", "beat": key[0], "column": key[1] if len(key) > 1 else None,
+                                "capture": capture.file})
+    return merged, diagnostics
 
-    def sort_event(event: Event):
-        return (event.target_beat, event.column)
+# merges captures of one chart into one note set, so that a note missed in one play is taken from another.
+# notes, wyrm finishes and vibe gains are counted per (beat, column) in every capture and the highest count is kept,
+# which is linear in the number of events however many captures there are.
+# returns the merged capture and every disagreement between the captures as diagnostics.
+def merge_captures(captures: list[Capture]) -> tuple[Capture, list[dict]]:
+    if len(captures) == 1:
+        return captures[0], []
     
-    short_note_events = sorted(short_note_events, key=sort_event)
-    wyrm_start_events = sorted(wyrm_start_events, key=sort_event)
-    wyrm_finish_events = sorted(wyrm_finish_events, key=sort_event)
+    first = captures[0]
+    for capture in captures[1:]:
+        if (capture.level_id, capture.difficulty) != (first.level_id, first.difficulty):
+            raise ValueError(f"{capture.file} is not a capture of the same chart as {first.file}")
 
-    short_notes: list[Note] = [Note(event) for event in short_note_events]
-    wyrm_notes: list[Note] = [Note(event) for event in wyrm_start_events]
+    merged = Capture(first.file)
+    merged.name, merged.level_id, merged.difficulty = first.name, first.level_id, first.difficulty
+    merged.base_bpm, merged.divisions = first.base_bpm, first.divisions
+    merged.event_count = sum(capture.event_count for capture in captures)
+
+    # enemy types seen at every (beat, column), over all captures
+    enemy_types: dict[tuple[float, int], Counter] = defaultdict(Counter)
+    for capture in captures:
+        for beat, column, enemy_type in capture.hits:
+            enemy_types[(beat, column)][enemy_type] += 1
+        merged.timing.update(capture.timing)
+
+    hits, diagnostics = merge_counts([Counter((beat, column) for beat, column, _ in capture.hits) for capture in captures], captures, "hit")
+    finishes, finish_diagnostics = merge_counts([Counter(capture.wyrm_finishes) for capture in captures], captures, "wyrm_finish")
+    gains, gain_diagnostics = merge_counts([Counter((beat,) for beat in capture.vibe_gains) for capture in captures], captures, "vibe_gain")
+    diagnostics += finish_diagnostics + gain_diagnostics
+
+    for (beat, column), count in hits.items():
+        enemy_type = enemy_types[(beat, column)].most_common(1)[0][0]
+        if len(enemy_types[(beat, column)]) > 1:
+            diagnostics.append({"type": "enemy_mismatch", "beat": beat, "column": column,
+                                "enemies": sorted(EnemyType(value).name for value in enemy_types[(beat, column)])})
+        merged.hits.extend([(beat, column, enemy_type)] * count)
+    merged.wyrm_finishes = list(finishes.elements())
+    merged.vibe_gains = [beat for (beat,) in gains.elements()]
+    return merged, diagnostics
+
+# decodes one or more captures of a chart into a Chart, keeping the hand-edited metadata of its existing JSON.
+# merge disagreements and wyrm pairing problems are printed, written to the trace and appended to diagnostics when given.
+def parse_captures(files: list[str], diagnostics: list[dict] = None) -> Chart:
+    captures = [capture for capture in (read_capture(file) for file in files) if capture is not None]
+    if not captures:
+        return None
     
-    for event in wyrm_finish_events:
-        target: Note = None
-        for note in wyrm_notes:
-            if note.beat_finish == 0.0 and note.column == event.column:
-                target = note
-                break
-        
-        if target:
-            target.beat_finish = event.target_beat
+    chart_diagnostics: list[dict] = []
+    start_time = time.perf_counter()
+    capture, merge_diagnostics = merge_captures(captures)
+    name = capture.name
+    if len(captures) > 1:
+        missing = Counter((diagnostic["capture"], diagnostic["type"]) for diagnostic in merge_diagnostics if "capture" in diagnostic)
+        for (file, kind), count in sorted(missing.items()):
+            print(f"MERGE in {name}: {os.path.basename(file)} has {count} {kind.replace('_', ' ')}(s)")
+        for diagnostic in merge_diagnostics:
+            if diagnostic["type"] == "enemy_mismatch":
+                print(f"MERGE in {name}: enemy mismatch at beat {diagnostic['beat']}, column {diagnostic['column']}: {', '.join(diagnostic['enemies'])}")
+        print(f"Merged {len(captures)} captures of {name}: {len(capture.hits)} notes, {len(merge_diagnostics)} disagreement(s)")
+        log_since("merge", start_time, captures=len(captures), notes=len(capture.hits), disagreements=len(merge_diagnostics))
+        chart_diagnostics.extend(merge_diagnostics)
+    
+    # create notes, sorted by (target_beat, column)
+    start_time = time.perf_counter()
+    short_notes: list[Note] = []
+    wyrm_notes: list[Note] = []
+    for beat, column, enemy_type in capture.hits:
+        if enemy_type == WYRM:
+            wyrm_notes.append(create_note(beat, EnemyType.WYRM, column))
         else:
-            print("WYRM ERROR")
+            short_notes.append(create_note(beat, EnemyType(enemy_type), column))
     
-    for note in wyrm_notes:
-        if note.beat_finish == 0.0:
-            print("WYRM ERROR")
-            break
+    def sort_note(note: Note):
+        return note.beat_start, note.column
+    
+    short_notes.sort(key=sort_note)
+    wyrm_notes.sort(key=sort_note)
+    capture.wyrm_finishes.sort()
+    
+    for diagnostic in pair_wyrms(wyrm_notes, capture.wyrm_finishes):
+        print(f"WYRM ERROR in {name}: {diagnostic['type']} at beat {diagnostic['beat']}, column {diagnostic['column']}")
+        chart_diagnostics.append(diagnostic)
+    log_since("notes", start_time, short_notes=len(short_notes), wyrm_notes=len(wyrm_notes))
 
     # assign combo
-    short_note_index = 0
-    wyrm_note_index = 0
-    combo = 0
-    while short_note_index < len(short_notes) or wyrm_note_index < len(wyrm_notes):
-        target_beat = 1e9
-        if short_note_index < len(short_notes):
-            target_beat = min(target_beat, short_notes[short_note_index].beat_start)
-        if wyrm_note_index < len(wyrm_notes):
-            target_beat = min(target_beat, wyrm_notes[wyrm_note_index].beat_start)
-
-        target_notes = []
-        while short_note_index < len(short_notes) and short_notes[short_note_index].beat_start == target_beat:
-            target_notes.append(short_notes[short_note_index])
-            short_note_index += 1
-        while wyrm_note_index < len(wyrm_notes) and wyrm_notes[wyrm_note_index].beat_start == target_beat:
-            target_notes.append(wyrm_notes[wyrm_note_index])
-            wyrm_note_index += 1
-        
-        combo += len(target_notes)
-        for note in target_notes:
-            note.combo = combo
-    
+    start_time = time.perf_counter()
+    group_beats, group_sizes = assign_combo(short_notes, wyrm_notes)
+    combo = sum(group_sizes)
+    stats = get_chart_stats(short_notes + wyrm_notes, group_beats, group_sizes)
+    log_since("combo", start_time, max_combo=combo, chords=sum(stats["chords"].values()))
+
     # create chart class
-    output_file = f"{name}_{difficulty.value}.json"
+    difficulty = capture.difficulty
+    output_file = f"{capture.get_chart_id()}.json"
     output_path = f"{PATH_JSON}/{output_file}"
 
     try:
-        with open(output_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        chart = load_chart(data)
+        chart = load_chart_file(output_path)
     except Exception as e:
         chart = Chart()
         print(f"- Failed to load data for '{output_file}': {e}")
 
     ## Do not uncomment!!
-    chart.id = f"{name}_{difficulty.value}"
+    chart.id = capture.get_chart_id()
     chart.name = name
     # chart.short_name = name
     chart.difficulty = difficulty
     # chart.intensity = 0
     chart.max_combo = combo
-    # chart.max_score = 0
-    chart.divisions = divisions
-    chart.base_bpm = base_bpm
+    chart.divisions = capture.divisions
+    chart.base_bpm = capture.base_bpm
     # chart.bpm_changes = [BpmChange(1,base_bpm)]
-    # chart.optimal_vibes = [VibeData(-1, -1)]
+    chart.stats = stats
     chart.short_notes = short_notes
     chart.wyrm_notes = wyrm_notes
+
+    # vibe path: only the hand-maintained vibe_path.csv row sets max_score and optimal_vibes.
+    # charts without one keep them as they are, and get the solver's unvalidated result as an estimate
+    target_row = find_vibe_row(name, difficulty)
+    if target_row is not None:
+        try:
+            apply_vibe(chart, target_row)
+        except Exception as e:
+            print(f"Cannot get vibe data for {name}: {e}")
+    if target_row is None:
+        start_time = time.perf_counter()
+        chart.estimated_max_score, chart.estimated_vibes = solve_vibes(short_notes + wyrm_notes, capture.timing.items(), capture.vibe_gains)
+        log_since("vibe_solve", start_time, gains=len(capture.vibe_gains), vibes=len(chart.estimated_vibes), max_score=chart.estimated_max_score)
+    else:
+        chart.estimated_max_score, chart.estimated_vibes = 0, []
+    
+    if chart_diagnostics:
+        log("diagnostics", count=len(chart_diagnostics), diagnostics=chart_diagnostics)
+    if diagnostics is not None:
+        diagnostics.extend(chart_diagnostics)
+    return chart
+
+def parse_chart(file, diagnostics: list[dict] = None) -> Chart:
+    return parse_captures([file], diagnostics)
+
+# (level_id, difficulty) of a capture, None when it is not one
+def read_capture_key(file) -> tuple[str, int]:
+    with open(file, "rb") as f:
+        capture = read_capture_header(f, file)
+    return None if capture is None else (capture.level_id, capture.difficulty.value)
+
+# chart id a capture is traced under, so its records join those of the later stages. the file stem when it cannot be read
+def read_chart_id(file) -> str:
+    capture = read_capture_file_header(file)
+    return get_chart_id(file) if capture is None else capture.get_chart_id()
+
+# groups captures of the same level and difficulty, by the first of their files
+def group_captures(bin_files: list[str]) -> dict[str, list[str]]:
+    groups: dict[tuple, list[str]] = defaultdict(list)
+    for file in sorted(bin_files):
+        # unreadable files stay on their own, and fail when parsed
+        try:
+            key = read_capture_key(file) or (file,)
+        except Exception:
+            key = (file,)
+        groups[key].append(file)
+    return {files[0]: files for files in groups.values()}
+
+# the vibe_path.csv row of a capture's chart, None when it has none (or the capture cannot be read)
+def find_capture_vibe_row(file) -> list[str]:
+    capture = read_capture_file_header(file)
+    return None if capture is None else find_vibe_row(capture.name, capture.difficulty)
+
+# a single capture keeps the plain file hash, so its manifest entry stays valid
+def get_parse_inputs(files: list[str]) -> dict[str, str]:
+    bin_hash = hash_file(files[0]) if len(files) == 1 else hash_value(sorted(hash_file(file) for file in files))
+    return {"bin": bin_hash, "vibe_row": hash_value(find_capture_vibe_row(files[0])),
+            "vibe_solver": hash_value(get_solver_constants())}
+
+def get_json_path(chart: Chart) -> str:
+    return f"{PATH_JSON}/{chart.id}.json"
+
+def parse(files: list[str], diagnostics: list[dict] = None) -> str:
+    chart = parse_captures(files, diagnostics)
+    if chart is None:
+        return None
     
     # export as JSON
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(chart, f, indent=4, cls=CustomJsonEncoder)
-    print(f"JSON data saved as {output_file}")
+    start_time = time.perf_counter()
+    output_path = get_json_path(chart)
+    save_chart(chart, output_path)
+    log_since("save_json", start_time, bytes=os.path.getsize(output_path))
+    print(f"JSON data saved as {os.path.basename(output_path)}")
+    return output_path
+
+# parses file together with the other captures of its group.
+# returns the written JSON path and the chart's diagnostics, or None on failure
+def parse_file(file, groups: dict[str, list[str]] = None) -> tuple[str, list[dict]]:
+    try:
+        with chart_scope(read_chart_id(file), "parse"):
+            diagnostics: list[dict] = []
+            output_path = parse(groups[file] if groups else [file], diagnostics)
+            return None if output_path is None else (output_path, diagnostics)
+    except Exception as e:
+        print(f"Parsing failed for file {file}: {e}")
+        traceback.print_exc()
+        return None
+
+# one line for all diagnostics of a run, each was printed when its chart was parsed
+def print_diagnostics_summary(diagnostics: dict[str, list[dict]]):
+    if not diagnostics:
+        return
+    counts = Counter(diagnostic["type"] for chart_diagnostics in diagnostics.values() for diagnostic in chart_diagnostics)
+    print(f"Diagnostics in {len(diagnostics)} chart(s): {', '.join(f'{count} {kind}' for kind, count in sorted(counts.items()))}")
+
+# parses only charts whose captures changed since the last recorded parse.
+# captures of the same level and difficulty are merged into one chart.
+# returns the diagnostics of every parsed chart that has any, by capture
+def parse_files(bin_files: list[str], jobs: int, force: bool = False) -> dict[str, list[dict]]:
+    manifest = Manifest()
+    groups = group_captures(bin_files)
+    inputs = {file: get_parse_inputs(files) for file, files in groups.items()}
+
+    stale_files = []
+    for file, files in groups.items():
+        if not force and all(manifest.is_fresh("parse", member, inputs[file]) for member in files):
+            print(f"Skipping up-to-date capture: {file}")
+        else:
+            stale_files.append(file)
+
+    results, _ = run_jobs(partial(parse_file, groups=groups), stale_files, jobs)
+    diagnostics: dict[str, list[dict]] = {}
+    for file, (output_path, chart_diagnostics) in results.items():
+        for member in groups[file]:
+            manifest.record("parse", member, inputs[file], [output_path])
+        if chart_diagnostics:
+            diagnostics[file] = chart_diagnostics
+    manifest.save()
+    print_diagnostics_summary(diagnostics)
+    return diagnostics
 
 if __name__ == "__main__":
     import argparse
@@ -159,23 +470,18 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("-a", "--all", action="store_true")
-    group.add_argument("-i", "--input")
+    group.add_argument("-i", "--input", nargs="+", help="captures to parse, several captures of one chart are merged")
+    parser.add_argument("-f", "--force", action="store_true", help="force parse even if capture is unchanged")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes for --all (default: core count)")
+    add_arguments(parser)
     args = parser.parse_args()
+    apply_arguments(args)
 
     if args.all:
         bin_files = glob.glob(os.path.join(PATH_RAW, "*.bin"))
-        for file in bin_files:
-            try:
-                parse(file)
-            except Exception as e:
-                print(f"Parsing failed for file {file}: {e}")
-                traceback.print_exc()
+        parse_files(bin_files, args.jobs, args.force)
     else:
         if not args.input:
             parser.error("Should specify input. Type --help for more information.")
         else:
-            try:
-                parse(args.input)
-            except Exception as e:
-                print(f"Parsing failed for file {args.input}: {e}")
-                traceback.print_exc()
+            parse_files(args.input, 1, args.force)
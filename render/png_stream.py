@@ -0,0 +1,93 @@
+import struct, zlib, tempfile
+from PIL import Image, ImageChops
+
+# Streaming PNG writer for images built from vertical strips (chart segments).
+# PNG stores full-width rows, so strips are spooled as raw RGB to a temporary file as they arrive,
+# then the rows are stitched from that file band by band while encoding.
+# Only one strip, or one band of rows, is ever held in memory.
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+IDAT_SIZE = 1 << 16
+BAND_HEIGHT = 64
+FILTER_UP = b"\x02"
+
+def write_chunk(f, chunk_type: bytes, data: bytes) -> None:
+    f.write(struct.pack(">I", len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+class PngStripWriter():
+    def __init__(self, path, compress_level: int = 6):
+        self.path = path
+        self.compress_level = compress_level
+        self.spool = tempfile.TemporaryFile()
+        self.strips: list[tuple[int, int]] = []    # (offset, width) of every strip in spool
+        self.width = 0
+        self.height = 0
+
+    def add(self, img: Image.Image) -> None:
+        if self.height and img.height != self.height:
+            raise ValueError(f"strip height {img.height} differs from {self.height}")
+        self.height = img.height
+        self.strips.append((self.spool.tell(), img.width))
+        self.spool.write(img.convert("RGB").tobytes())
+        self.width += img.width
+
+    def close(self) -> None:
+        try:
+            if self.strips:
+                self.encode()
+        finally:
+            self.spool.close()
+
+    def encode(self) -> None:
+        width, height = self.width, self.height
+        row_size = width * 3
+        with open(self.path, "wb") as f:
+            f.write(PNG_SIGNATURE)
+            # 8-bit RGB, no interlace
+            write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+            compressor = zlib.compressobj(self.compress_level)
+            pending = bytearray()
+            prior_row = Image.new("RGB", (width, 1))
+            for band_start in range(0, height, BAND_HEIGHT):
+                band_height = min(BAND_HEIGHT, height - band_start)
+
+                # rows of a strip are contiguous in the spool, so every strip is one read per band
+                band = Image.new("RGB", (width, band_height))
+                x = 0
+                for offset, strip_width in self.strips:
+                    self.spool.seek(offset + band_start * strip_width * 3)
+                    data = self.spool.read(band_height * strip_width * 3)
+                    band.paste(Image.frombytes("RGB", (strip_width, band_height), data), (x, 0))
+                    x += strip_width
+
+                # "Up" filter: every byte minus the byte above it, mod 256.
+                # rows are much wider than zlib's window, so unfiltered repeats would not compress.
+                prior = Image.new("RGB", (width, band_height))
+                prior.paste(prior_row, (0, 0))
+                prior.paste(band.crop((0, 0, width, band_height - 1)), (0, 1))
+                filtered = ImageChops.subtract_modulo(band, prior).tobytes()
+                prior_row = band.crop((0, band_height - 1, width, band_height))
+
+                for row in range(band_height):
+                    pending += FILTER_UP
+                    pending += filtered[row * row_size:(row + 1) * row_size]
+                if len(pending) >= IDAT_SIZE:
+                    compressed = compressor.compress(bytes(pending))
+                    pending.clear()
+                    if compressed:
+                        write_chunk(f, b"IDAT", compressed)
+            write_chunk(f, b"IDAT", compressor.compress(bytes(pending)) + compressor.flush())
+            write_chunk(f, b"IEND", b"")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.spool.close()
@@ -1,5 +1,7 @@
-import os, glob, json, datetime, markdown, traceback
+import os, glob, time, datetime, markdown, traceback
 from rift_essentials import *
+from manifest import *
+from instrument import log_since, chart_scope, get_chart_id, add_arguments, apply_arguments
 
 # Charts
 html_template_chart = """<!DOCTYPE html>
@@ -48,39 +50,64 @@ html_template_chart = """<!DOCTYPE html>
         </div>
 
         <div class="content">
-            <img
-                id="chart-img-normal"
-                src="{chart_normal_src}"
-                alt="{song_name}" />
-            <img
-                id="chart-img-enemy-render"
-                src="{chart_enemy_render_src}"
-                alt="{song_name}" />
+            {chart_normal}
+            {chart_enemy_render}
         </div>
     </body>
 </html>
 """
 
-def render_chart_html(file):
-    try:
-        with open(file) as f:
-            data = json.load(f)
-    except Exception as e:
-        print(f"Failed JSON open on {file}: {e}")
-        traceback.print_exc()
-        return
-        
-    chart = load_chart(data)
+# a chart is shown either as one image, or as a deep-zoom pyramid when flatten.py rendered one
+chart_image_template = """<img
+                id="{element_id}"
+                src="{src}"
+                alt="{song_name}" />"""
+
+chart_pyramid_template = """<div
+                id="{element_id}"
+                class="chart-pyramid"
+                data-pyramid="{src}"></div>"""
+
+def get_chart_sources(chart: Chart) -> dict[str, tuple[str, str]]:
+    file_hierarchy = f"{chart.name}/{chart.difficulty.name.lower()}"
+    file_name = f"{chart.name}_{chart.difficulty.name.lower()}"
     
+    sources = {}
+    for element_id, suffix in (("chart-img-normal", ""), ("chart-img-enemy-render", "_er")):
+        pyramid_path = f"{file_hierarchy}/{file_name}{suffix}_pyramid/pyramid.json"
+        svg_path = f"{file_hierarchy}/{file_name}{suffix}.svg"
+        if os.path.exists(os.path.join(PATH_FLAT, pyramid_path)):
+            sources[element_id] = ("pyramid", f"../flat/{pyramid_path}")
+        elif os.path.exists(os.path.join(PATH_FLAT, svg_path)):
+            sources[element_id] = ("image", f"../flat/{svg_path}")
+        else:
+            sources[element_id] = ("image", f"../flat/{file_hierarchy}/{file_name}{suffix}.png")
+    return sources
+
+def create_chart_element(element_id: str, source: tuple[str, str], song_name: str) -> str:
+    mode, src = source
+    template = chart_pyramid_template if mode == "pyramid" else chart_image_template
+    return template.format(element_id=element_id, src=src, song_name=song_name)
+
+def render_chart_html(file) -> str:
+    with chart_scope(get_chart_id(file), "html"):
+        try:
+            chart = load_chart_file(file)
+        except Exception as e:
+            print(f"Failed JSON open on {file}: {e}")
+            traceback.print_exc()
+            return None
+        
+        return write_chart_html(chart)
+
+def write_chart_html(chart: Chart) -> str:
+    start_time = time.perf_counter()
     name = chart.name
     difficulty = chart.difficulty
     intensity = chart.intensity
 
-    file_hierarchy = f"../flat/{name}/{difficulty.name.lower()}"
     file_name = f"{name}_{difficulty.name.lower()}"
-    
-    chart_path_normal = f"{file_hierarchy}/{file_name}.png"
-    chart_path_enemy_render = f"{file_hierarchy}/{file_name}_er.png"
+    sources = get_chart_sources(chart)
     
     base_bpm = chart.base_bpm
     max_bpm = max(bpm_change.bpm for bpm_change in chart.bpm_changes)
@@ -89,6 +116,9 @@ def render_chart_html(file):
     
     max_combo = chart.max_combo
     max_score = chart.max_score
+    # the solver's estimate is only shown where the spreadsheet has no score, and labelled as such
+    if not max_score and chart.estimated_max_score:
+        max_score = f"~{chart.estimated_max_score} (estimated)"
 
     html_content = html_template_chart.format(
         song_name=name,
@@ -97,16 +127,20 @@ def render_chart_html(file):
         bpm=bpm_str,
         max_combo=max_combo,
         max_score=max_score,
-        chart_normal_src=chart_path_normal,
-        chart_enemy_render_src=chart_path_enemy_render)
+        chart_normal=create_chart_element("chart-img-normal", sources["chart-img-normal"], name),
+        chart_enemy_render=create_chart_element("chart-img-enemy-render", sources["chart-img-enemy-render"], name))
 
+    output_path = os.path.join(PATH_HTML, f"{file_name}.html")
     try:
-        with open(os.path.join(PATH_HTML, f"{file_name}.html"), "w", encoding="utf-8") as f:
+        with open(output_path, "w", encoding="utf-8") as f:
             f.write(html_content)
+        log_since("write_html", start_time, bytes=os.path.getsize(output_path))
         print(f"HTML render success on {file_name}).")
+        return output_path
     except Exception as e:
         print(f"HTML render failed on {file_name}): {e}")
         traceback.print_exc()
+        return None
 
 # Homepage
 html_template_homepage = """<!DOCTYPE html>
@@ -143,40 +177,49 @@ row_template = """<tr>
     <td>
         <a href="./render/html/{file_name}.html" class="song-name">{short_name}</a>
     </td>
-</tr>
+{thumbnail}</tr>
 """
 
-def create_row_html(file) -> str:
-    with open(file) as f:
-        data = json.load(f)
-    
-    chart = load_chart(data)
-    
+thumbnail_template = """    <td>
+        <a href="./render/html/{file_name}.html">
+            <img src="./render/flat/{src}" class="chart-thumbnail" loading="lazy">
+        </a>
+    </td>
+"""
+
+# plain chart rendered natively at 1x (flatten.py --scale 1), shown on the homepage when it exists
+def get_chart_thumbnail(chart: Chart) -> str:
+    thumbnail_path = f"{chart.name}/{chart.difficulty.name.lower()}/{chart.name}_{chart.difficulty.name.lower()}@1x.png"
+    return thumbnail_path if os.path.exists(os.path.join(PATH_FLAT, thumbnail_path)) else None
+
+def create_row_html(chart: Chart) -> str:
     name = chart.name
     short_name = chart.short_name
     difficulty = chart.difficulty
     
     file_name = f"{name}_{difficulty.name.lower()}"
     
-    row_html_segment = row_template.format(file_name=file_name, song_name=name, short_name=short_name)
+    thumbnail_path = get_chart_thumbnail(chart)
+    thumbnail = thumbnail_template.format(file_name=file_name, src=thumbnail_path) if thumbnail_path else ""
+    row_html_segment = row_template.format(file_name=file_name, song_name=name, short_name=short_name, thumbnail=thumbnail)
     
     return row_html_segment
 
-def render_homepage_html():
-    json_files = glob.glob(os.path.join(PATH_JSON, "*.json"))
-
+def render_homepage_html(charts: list[Chart]):
+    start_time = time.perf_counter()
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M (UTC+09:00)")
     print(timestamp)
     
     row_segments = """"""
-    for file in json_files:
-        row_segments += create_row_html(file)
+    for chart in charts:
+        row_segments += create_row_html(chart)
     
     html_content = html_template_homepage.format(timestamp=timestamp,
                                         row_segments=row_segments)
     
     with open("../index.html", "w", encoding="utf-8") as f:
         f.write(html_content)
+    log_since("homepage", start_time, charts=len(charts), bytes=os.path.getsize("../index.html"))
 
 # Changelog
 html_template_changelog = """<!DOCTYPE html>
@@ -207,9 +250,49 @@ def render_changelog_html():
     with open("../changelog.html", "w", encoding="utf-8") as f:
         f.write(html_content)
 
+# Incremental build
+# every page is rebuilt only when its inputs or its template changed
+def get_chart_html_inputs(file) -> dict[str, str]:
+    return {"json": hash_file(file),
+            "sources": hash_value(get_chart_sources(load_chart_file(file))),
+            "template": hash_value([html_template_chart, chart_image_template, chart_pyramid_template])}
+
+def render_site_html(json_files: list[str], manifest: Manifest, force: bool = False, charts: dict[str, Chart] = None):
+    # charts already in memory are given by manifest key, the rest are loaded from JSON
+    charts = charts or {}
+    inputs = {"json": hash_value({manifest_key(file): hash_file(file) for file in json_files}),
+              "thumbnails": hash_value(sorted(manifest_key(path) for path in glob.glob(os.path.join(PATH_FLAT, "*", "*", "*@1x.png")))),
+              "template": hash_value([html_template_homepage, row_template, thumbnail_template])}
+    if force or not manifest.is_fresh("html", "homepage", inputs):
+        render_homepage_html([charts[manifest_key(file)] if manifest_key(file) in charts else load_chart_file(file)
+                              for file in json_files])
+        manifest.record("html", "homepage", inputs, ["../index.html"])
+
+    inputs = {"changelog": hash_file("changelog.md"), "template": hash_value(html_template_changelog)}
+    if force or not manifest.is_fresh("html", "changelog", inputs):
+        render_changelog_html()
+        manifest.record("html", "changelog", inputs, ["../changelog.html"])
+
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--force", action="store_true", help="force render even if inputs are unchanged")
+    add_arguments(parser)
+    args = parser.parse_args()
+    apply_arguments(args)
+
+    manifest = Manifest()
     json_files = glob.glob(os.path.join(PATH_JSON, "*.json"))
+
     for file in json_files:
-        render_chart_html(file)
-    render_homepage_html()
-    render_changelog_html()
\ No newline at end of file
+        inputs = get_chart_html_inputs(file)
+        if not args.force and manifest.is_fresh("html", file, inputs):
+            print(f"Skipping up-to-date HTML: {file}")
+            continue
+        output_path = render_chart_html(file)
+        if output_path:
+            manifest.record("html", file, inputs, [output_path])
+
+    render_site_html(json_files, manifest, args.force)
+    manifest.save()
@@ -1,5 +1,6 @@
-import json
+import json, os, struct, hashlib, traceback
 from enum import Enum
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 URL = "riftchart.shortcake.kr"
 
@@ -8,6 +9,10 @@ PATH_JSON = "./json"
 PATH_FLAT = "./flat"
 PATH_HTML = "./html"
 PATH_ENEMIES = "./enemies"
+PATH_MANIFEST = "./manifest.json"
+PATH_CACHE = "./cache"
+
+USE_CHART_CACHE = True
 
 class DifficultyType(Enum):
     EASY = 0
@@ -61,22 +66,31 @@ class EnemyType(Enum):
     DRUMSTICK = 32
     HAM = 33
 
+# Data classes use __slots__: charts hold thousands of notes, and a per-instance __dict__ dominates their memory.
+# Slot order is also the key order of their JSON (see CustomJsonEncoder).
+
 class Event():
-    event_type: EventType = EventType.MISS
-    time: float = 0
-    beat: float = 0
-    target_time: float = 0
-    target_beat: float = 0
-    enemy_type: EnemyType = EnemyType.NONE
-    column: int = 0
-    total_score: int = 0
-    base_score: int = 0
-    base_score_multiplier: int = 0
-    vibe_score_multiplier: int = 0
-    bonus_score: int = 0
-    is_vibe: bool = 0
+    __slots__ = ("event_type", "time", "beat", "target_time", "target_beat", "enemy_type", "column",
+                 "total_score", "base_score", "base_score_multiplier", "vibe_score_multiplier", "bonus_score", "is_vibe")
+
+    def __init__(self):
+        self.event_type: EventType = EventType.MISS
+        self.time: float = 0
+        self.beat: float = 0
+        self.target_time: float = 0
+        self.target_beat: float = 0
+        self.enemy_type: EnemyType = EnemyType.NONE
+        self.column: int = 0
+        self.total_score: int = 0
+        self.base_score: int = 0
+        self.base_score_multiplier: int = 0
+        self.vibe_score_multiplier: int = 0
+        self.bonus_score: int = 0
+        self.is_vibe: bool = False
 
 class Note:
+    __slots__ = ("beat_start", "beat_finish", "enemy_type", "column", "combo", "is_vibe")
+
     def __init__(self, event: Event):
         self.beat_start: float = event.target_beat
         self.beat_finish: float = event.target_beat if event.enemy_type != EnemyType.WYRM else 0.0
@@ -86,6 +100,16 @@ class Note:
         # self.is_vibe: bool = event.is_vibe
         self.is_vibe: bool = False
 
+def create_note(beat: float, enemy_type: EnemyType, column: int) -> Note:
+    note = Note.__new__(Note)  # Bypass __init__, same as Note(event) without an Event
+    note.beat_start = beat
+    note.beat_finish = beat if enemy_type != EnemyType.WYRM else 0.0
+    note.enemy_type = enemy_type
+    note.column = column
+    note.combo = 0
+    note.is_vibe = False
+    return note
+
 def load_note(data: dict) -> Note:
     note = Note.__new__(Note)  # Bypass __init__
     note.beat_start = data.get("beat_start", 0)
@@ -98,6 +122,8 @@ def load_note(data: dict) -> Note:
     return note
 
 class BpmChange():
+    __slots__ = ("beat", "bpm")
+
     def __init__(self, beat: float = 0, bpm: int = 0):
         self.beat = beat
         self.bpm = bpm
@@ -109,6 +135,8 @@ def load_bpm_change(data: dict) -> BpmChange:
     return bpm_change
 
 class VibeData():
+    __slots__ = ("beat", "enemies")
+
     def __init__(self, beat: float = 0, enemies: int = 0):
         self.beat = beat
         self.enemies = enemies
@@ -120,19 +148,28 @@ def load_vibe_data(data: dict) -> VibeData:
     return vibe_data
 
 class Chart():
-    id: str = ""
-    name: str = ""
-    short_name: str = ""
-    difficulty: DifficultyType = DifficultyType.EASY
-    intensity: int = 0
-    max_combo: int = 0
-    max_score: int = 0
-    divisions: int = 0
-    base_bpm: int = 0
-    bpm_changes: list[BpmChange] = []
-    optimal_vibes: list[VibeData] = []
-    short_notes : list[Note] = []
-    wyrm_notes : list[Note] =  []
+    __slots__ = ("id", "name", "short_name", "difficulty", "intensity", "max_combo", "max_score",
+                 "divisions", "base_bpm", "bpm_changes", "optimal_vibes", "stats", "estimated_max_score", "estimated_vibes",
+                 "short_notes", "wyrm_notes")
+
+    def __init__(self):
+        self.id: str = ""
+        self.name: str = ""
+        self.short_name: str = ""
+        self.difficulty: DifficultyType = DifficultyType.EASY
+        self.intensity: int = 0
+        self.max_combo: int = 0
+        self.max_score: int = 0
+        self.divisions: int = 0
+        self.base_bpm: int = 0
+        self.bpm_changes: list[BpmChange] = []
+        self.optimal_vibes: list[VibeData] = []
+        self.stats: dict = {}  # computed by parse, see parse.get_chart_stats
+        # unvalidated vibe_solver estimate for charts without a vibe_path.csv row, never copied into max_score/optimal_vibes
+        self.estimated_max_score: int = 0
+        self.estimated_vibes: list[VibeData] = []
+        self.short_notes: list[Note] = []
+        self.wyrm_notes: list[Note] = []
 
 def load_chart(data: dict) -> Chart:
     chart = Chart()
@@ -148,19 +185,149 @@ def load_chart(data: dict) -> Chart:
 
     chart.bpm_changes = [load_bpm_change(sub_data) for sub_data in data.get("bpm_changes", [])]
     chart.optimal_vibes = [load_vibe_data(sub_data) for sub_data in data.get("optimal_vibes", [])]
+    chart.stats = data.get("stats", {})
+    chart.estimated_max_score = data.get("estimated_max_score", 0)
+    chart.estimated_vibes = [load_vibe_data(sub_data) for sub_data in data.get("estimated_vibes", [])]
 
     chart.short_notes = [load_note(sub_data) for sub_data in data.get("short_notes", [])]
     chart.wyrm_notes = [load_note(sub_data) for sub_data in data.get("wyrm_notes", [])]
 
     return chart
 
+# Compact chart cache
+# JSON stays the canonical, human-editable source. Next to it, a binary copy stores the
+# metadata as JSON and the notes as packed little-endian columns, keyed by the JSON's hash:
+#   magic, version, sha256(JSON), metadata length, metadata,
+#   then for short notes and wyrm notes: count, beat_start[], beat_finish[], combo[], column[], enemy_type[], is_vibe[]
+CACHE_MAGIC = b"RFCC"
+CACHE_VERSION = 3
+CACHE_HEADER = struct.Struct("<4si32si")
+CHART_METADATA = ["id", "name", "short_name", "difficulty", "intensity", "max_combo", "max_score",
+                  "divisions", "base_bpm", "bpm_changes", "optimal_vibes", "stats", "estimated_max_score", "estimated_vibes"]
+ENEMY_TYPES = {enemy_type.value: enemy_type for enemy_type in EnemyType}
+
+def get_cache_path(file) -> str:
+    return os.path.join(PATH_CACHE, os.path.splitext(os.path.basename(file))[0] + ".chart")
+
+def pack_notes(notes: list[Note]) -> bytes:
+    count = len(notes)
+    return b"".join([
+        struct.pack("<i", count),
+        struct.pack(f"<{count}d", *(note.beat_start for note in notes)),
+        struct.pack(f"<{count}d", *(note.beat_finish for note in notes)),
+        struct.pack(f"<{count}i", *(note.combo for note in notes)),
+        struct.pack(f"<{count}b", *(note.column for note in notes)),
+        struct.pack(f"<{count}B", *(note.enemy_type.value for note in notes)),
+        struct.pack(f"<{count}?", *(note.is_vibe for note in notes)),
+    ])
+
+def unpack_notes(data, offset: int) -> tuple[list[Note], int]:
+    count = struct.unpack_from("<i", data, offset)[0]
+    offset += 4
+    columns = []
+    for fmt, size in (("d", 8), ("d", 8), ("i", 4), ("b", 1), ("B", 1), ("?", 1)):
+        columns.append(struct.unpack_from(f"<{count}{fmt}", data, offset))
+        offset += count * size
+
+    notes = []
+    for beat_start, beat_finish, combo, column, enemy_type, is_vibe in zip(*columns):
+        note = Note.__new__(Note)  # Bypass __init__
+        note.beat_start = beat_start
+        note.beat_finish = beat_finish
+        note.enemy_type = ENEMY_TYPES[enemy_type]
+        note.column = column
+        note.combo = combo
+        note.is_vibe = is_vibe
+        notes.append(note)
+    return notes, offset
+
+def save_chart_cache(chart: Chart, json_hash: bytes, path) -> None:
+    metadata = json.dumps({key: getattr(chart, key) for key in CHART_METADATA}, cls=CustomJsonEncoder).encode("utf-8")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, json_hash, len(metadata)))
+        f.write(metadata)
+        f.write(pack_notes(chart.short_notes))
+        f.write(pack_notes(chart.wyrm_notes))
+
+# returns None when the cache is missing, outdated or unreadable
+def load_chart_cache(json_hash: bytes, path) -> Chart:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, cached_hash, metadata_length = CACHE_HEADER.unpack_from(data, 0)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION or cached_hash != json_hash:
+            return None
+
+        offset = CACHE_HEADER.size
+        chart = load_chart(json.loads(data[offset:offset + metadata_length]))
+        offset += metadata_length
+        chart.short_notes, offset = unpack_notes(data, offset)
+        chart.wyrm_notes, offset = unpack_notes(data, offset)
+        return chart
+    except (OSError, struct.error, ValueError, KeyError):
+        return None
+
+# loads a chart JSON through its binary cache, regenerating the cache when the JSON changed
+def load_chart_file(file, use_cache: bool = USE_CHART_CACHE) -> Chart:
+    with open(file, "rb") as f:
+        data = f.read()
+    if not use_cache:
+        return load_chart(json.loads(data))
+    
+    json_hash = hashlib.sha256(data).digest()
+    cache_path = get_cache_path(file)
+    chart = load_chart_cache(json_hash, cache_path)
+    if chart is None:
+        chart = load_chart(json.loads(data))
+        try:
+            save_chart_cache(chart, json_hash, cache_path)
+        except Exception as e:
+            print(f"Failed saving chart cache on {cache_path}: {e}")
+    return chart
+
+def save_chart(chart: Chart, file) -> None:
+    with open(file, "w", encoding="utf-8") as f:
+        json.dump(chart, f, indent=4, cls=CustomJsonEncoder)
+
 class CustomJsonEncoder(json.JSONEncoder):
     def default(self, obj):
-        if (isinstance(obj, Note) or
-            isinstance(obj, BpmChange) or
-            isinstance(obj, VibeData) or
-            isinstance(obj, Chart)):
-            return obj.__dict__
+        if isinstance(obj, (Note, BpmChange, VibeData, Chart)):
+            return {key: getattr(obj, key) for key in obj.__slots__}
         elif isinstance(obj, Enum):
             return obj.name
         return super().default(obj)
+
+# runs func(file) for every file, on a process pool if jobs > 1, then prints a summary.
+# a falsy result counts as failure; results of succeeded files are returned by file.
+def run_jobs(func, files: list[str], jobs: int = os.cpu_count(), initializer=None, initargs: tuple = ()) -> tuple[dict[str, object], list[str]]:
+    succeeded: dict[str, object] = {}
+    failed: list[str] = []
+
+    def collect(file: str, result):
+        if result:
+            succeeded[file] = result
+        else:
+            failed.append(file)
+
+    if jobs is None or jobs <= 1 or len(files) <= 1:
+        for file in files:
+            collect(file, func(file))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs) as executor:
+            futures = {executor.submit(func, file): file for file in files}
+            for future in as_completed(futures):
+                file = futures[future]
+                try:
+                    collect(file, future.result())
+                except Exception as e:
+                    print(f"Worker failed for file {file}: {e}")
+                    traceback.print_exception(type(e), e, e.__traceback__)
+                    collect(file, False)
+
+    print(f"Done: {len(succeeded)} succeeded, {len(failed)} failed")
+    for file in sorted(succeeded):
+        print(f"+ {file}")
+    for file in sorted(failed):
+        print(f"- {file}")
+    return succeeded, failed
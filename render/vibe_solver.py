@@ -0,0 +1,108 @@
+import bisect
+from itertools import accumulate
+from rift_essentials import *
+
+# Optimal vibe solver, estimating max score and vibes of charts that have no vibe_path.csv row.
+# Its result is stored apart (Chart.estimated_max_score, Chart.estimated_vibes): the vibe rules below are
+# not calibrated, since no capture holds a VIBE_ACTIVATED event, and it does not reproduce the spreadsheet's
+# scores even for the spreadsheet's own vibe paths.
+# Scoring, as measured on Golden Lute captures:
+#   every hit scores HIT_SCORE times the combo multiplier (x1, +1 every COMBO_STEP hits, up to MAX_MULTIPLIER) plus PERFECT_BONUS
+#   every beat a wyrm is held after its head scores HOLD_SCORE
+#   during vibe, hits and holds score their base twice (the bonus is not doubled)
+# Vibe (guessed): every vibe gain adds a bar, up to VIBE_MAX_BARS, and gains while full are lost.
+# Activating spends every bar for VIBE_SECONDS each, and a gain during vibe extends it by VIBE_SECONDS.
+HIT_SCORE       = 555
+HOLD_SCORE      = 333
+PERFECT_BONUS   = 2
+COMBO_STEP      = 10
+MAX_MULTIPLIER  = 4
+VIBE_SECONDS    = 5.0
+VIBE_MAX_BARS   = 2
+VIBE_TOLERANCE  = 0.05  # seconds; notes this late after the vibe ends still count, like the hit window
+
+# recorded with every parse, so changing the scoring rules re-parses the charts
+def get_solver_constants() -> dict:
+    return {name: value for name, value in globals().items() if name.isupper() and isinstance(value, (int, float))}
+
+def get_combo_multiplier(combo: int) -> int:
+    return min(MAX_MULTIPLIER, 1 + combo // COMBO_STEP)
+
+# seconds of a beat, interpolated between (beat, time) points sorted by beat
+def get_beat_time(timing: list[tuple[float, float]], beat: float) -> float:
+    index = bisect.bisect_left(timing, (beat, float("-inf")))
+    if index < len(timing) and timing[index][0] == beat:
+        return timing[index][1]
+    if len(timing) < 2:
+        return timing[0][1] if timing else 0.0
+    index = min(max(index, 1), len(timing) - 1)
+    (beat_from, time_from), (beat_to, time_to) = timing[index - 1], timing[index]
+    return time_from + (time_to - time_from) * (beat - beat_from) / (beat_to - beat_from)
+
+# (time, beat, score doubled by vibe, is hit) of every hit and held wyrm beat sorted by time, and the score without vibe
+def get_score_items(notes: list[Note], timing: list[tuple[float, float]]) -> tuple[list[tuple], int]:
+    items = []
+    base_score = 0
+    for combo, note in enumerate(sorted(notes, key=lambda note: (note.beat_start, note.column))):
+        score = HIT_SCORE * get_combo_multiplier(combo)
+        base_score += score + PERFECT_BONUS
+        items.append((get_beat_time(timing, note.beat_start), note.beat_start, score, True))
+
+        if note.enemy_type == EnemyType.WYRM:
+            beat = note.beat_start + 1
+            while beat <= note.beat_finish:
+                base_score += HOLD_SCORE
+                items.append((get_beat_time(timing, beat), beat, HOLD_SCORE, False))
+                beat += 1
+    items.sort()
+    return items, base_score
+
+# returns (max score, optimal vibes) of the notes.
+# timing holds (beat, time) points of the capture's hits, vibe_gains the beats where vibe was gained.
+def solve_vibes(notes: list[Note], timing: list[tuple[float, float]], vibe_gains: list[float]) -> tuple[int, list[VibeData]]:
+    timing = sorted(dict(timing).items())  # one point per beat, chords repeat it
+    items, base_score = get_score_items(notes, timing)
+    times = [item[0] for item in items]
+    scores = [0, *accumulate(item[2] for item in items)]
+    hits = [0, *accumulate(item[3] for item in items)]
+    gains = sorted(get_beat_time(timing, beat) for beat in vibe_gains)
+    item_count, gain_count = len(items), len(gains)
+
+    # vibe from item start with bars, extended by the gains from gain_index on that come during it.
+    # returns (first item after the vibe, first gain after the vibe)
+    def get_vibe_end(start: int, bars: int, gain_index: int) -> tuple[int, int]:
+        end_time = times[start] + VIBE_SECONDS * bars
+        while gain_index < gain_count and gains[gain_index] <= end_time:
+            end_time += VIBE_SECONDS
+            gain_index += 1
+        return bisect.bisect_right(times, end_time + VIBE_TOLERANCE), gain_index
+
+    # best[gain][item]: most vibe score from the gains from gain on, with no vibe before item.
+    # choice[gain][item]: (start, end, next gain) of the first vibe on that path
+    best = [[0] * (item_count + 1) for _ in range(gain_count + 1)]
+    choice = [[None] * (item_count + 1) for _ in range(gain_count + 1)]
+    for gain in range(gain_count - 1, -1, -1):
+        first = bisect.bisect_left(times, gains[gain])
+        # starting before the next gain spends one bar, after it two (gains in between are lost)
+        next_gain_item = bisect.bisect_left(times, gains[gain + 1]) if gain + 1 < gain_count else item_count
+        gain_best, gain_choice = best[gain], choice[gain]
+        running = (0, None)
+        for start in range(item_count - 1, first - 1, -1):
+            if start < next_gain_item:
+                end, next_gain = get_vibe_end(start, 1, gain + 1)
+            else:
+                end, next_gain = get_vibe_end(start, VIBE_MAX_BARS, bisect.bisect_right(gains, times[start]))
+            score = scores[end] - scores[start] + best[next_gain][end]
+            if score >= running[0]:
+                running = (score, (start, end, next_gain))
+            gain_best[start], gain_choice[start] = running
+        for start in range(first):
+            gain_best[start], gain_choice[start] = gain_best[first], gain_choice[first]
+
+    optimal_vibes = []
+    gain, item = 0, 0
+    while gain < gain_count and choice[gain][item] is not None:
+        start, end, next_gain = choice[gain][item]
+        optimal_vibes.append(VibeData(items[start][1], hits[end] - hits[start]))
+        gain, item = next_gain, end
+    return base_score + best[0][0], optimal_vibes